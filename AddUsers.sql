@@ -31,3 +31,10 @@ INSERT INTO sales_stats (vehicle_stat_id, start_date, end_date, cars_sold, total
 VALUES 
     (1, '2020-12-15', '2023-10-05', 10, 12234.54),
     (2, '2020-10-01', '2023-11-11', 15, 14257.32);
+
+-- Backfill the daily sales rollup from the sold vehicles above
+INSERT INTO sales_daily_rollup (sale_date, make, model, cars_sold, total_profit)
+SELECT sold_at, make, model, COUNT(vehicle_id), SUM(profit)
+FROM vehicle
+WHERE sold_at IS NOT NULL
+GROUP BY sold_at, make, model;
@@ -1,4 +1,10 @@
--- Drop all tables if they exist
+-- Drop all tables if they exist (tables with foreign keys to vehicle/customer first)
+DROP TABLE IF EXISTS schema_version;
+DROP TABLE IF EXISTS outbox_event;
+DROP TABLE IF EXISTS cache_generation;
+DROP TABLE IF EXISTS bulk_sale_request;
+DROP TABLE IF EXISTS sale_request;
+DROP TABLE IF EXISTS sales_daily_rollup;
 DROP TABLE IF EXISTS service_appointment;
 DROP TABLE IF EXISTS service_package;
 DROP TABLE IF EXISTS sales_stats;
@@ -71,3 +77,70 @@ CREATE TABLE sales_stats (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (vehicle_stat_id) REFERENCES vehicle(vehicle_id) ON DELETE CASCADE
 );
+
+-- Create the Sales Daily Rollup table (rebuild with `flask rebuild-sales-rollup`)
+CREATE TABLE sales_daily_rollup (
+    rollup_id INT AUTO_INCREMENT PRIMARY KEY,
+    sale_date DATE NOT NULL,
+    make VARCHAR(40),
+    model VARCHAR(40),
+    cars_sold INT NOT NULL DEFAULT 0,
+    total_profit DECIMAL(12,2) DEFAULT NULL,
+    UNIQUE KEY uq_sales_daily_rollup (sale_date, make, model)
+);
+
+-- Create the Sale Request table (idempotency keys of recorded /sell_car sales)
+CREATE TABLE sale_request (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    request_hash VARCHAR(64) NOT NULL,
+    vehicle_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    created_at DATETIME DEFAULT NULL,
+    FOREIGN KEY (vehicle_id) REFERENCES vehicle(vehicle_id),
+    FOREIGN KEY (customer_id) REFERENCES customer(customer_id)
+);
+
+-- Create the Bulk Sale Request table (idempotency keys and results of /sales/bulk batches)
+CREATE TABLE bulk_sale_request (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    request_hash VARCHAR(64) NOT NULL,
+    results TEXT NOT NULL,
+    created_at DATETIME DEFAULT NULL
+);
+
+-- Create the Outbox Event table (applied by `flask outbox-worker`)
+CREATE TABLE outbox_event (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(40) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    processed_at DATETIME DEFAULT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(200) DEFAULT NULL
+);
+
+-- Create the Cache Generation table (bumped by the outbox worker, polled by web workers)
+CREATE TABLE cache_generation (
+    namespace VARCHAR(40) PRIMARY KEY,
+    generation INT NOT NULL DEFAULT 0
+);
+
+-- Create the Schema Version table (written by `flask ensure-schema` and run.py)
+CREATE TABLE schema_version (
+    schema_version_id INT AUTO_INCREMENT PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    applied_at DATETIME NOT NULL
+);
+
+-- Lookup indexes (apply to an existing database with `flask migrate-indexes`)
+CREATE INDEX ix_customer_name ON customer (last_name, first_name);
+CREATE INDEX ix_vehicle_sold_at ON vehicle (sold_at);
+CREATE INDEX ix_vehicle_make_model ON vehicle (make, model);
+CREATE INDEX ix_vehicle_owner_id ON vehicle (owner_id);
+CREATE INDEX ix_sales_stats_vehicle_stat_id ON sales_stats (vehicle_stat_id);
+CREATE INDEX ix_service_appointment_appt_date ON service_appointment (appt_date);
+CREATE INDEX ix_service_appointment_service_customer_id ON service_appointment (service_customer_id);
+CREATE INDEX ix_service_appointment_vehicle_serviced_id ON service_appointment (vehicle_serviced_id);
+CREATE INDEX ix_sale_request_created_at ON sale_request (created_at);
+CREATE INDEX ix_bulk_sale_request_created_at ON bulk_sale_request (created_at);
+CREATE INDEX ix_outbox_event_pending ON outbox_event (processed_at, event_id);
@@ -1,14 +1,111 @@
+import os
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import configure_mappers
+
+from app.routing import RoutingSession
+from app.startup import startup_profile
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
-def create_app():
+def create_app(config_object=None):
+    startup_profile.start()
     app = Flask(__name__)
-    app.config.from_object("config.Config")
+    app.config.from_object(config_object or os.environ.get("APP_CONFIG", "config.Config"))
+    if not app.config.get("SECRET_KEY"):
+        raise RuntimeError("SECRET_KEY is not set; export it before starting the app.")
+    startup_profile.mark("config")
+    from app import routing
+    routing.add_replica_binds(app)
     db.init_app(app)
+    startup_profile.mark("database")
+
+    from app import logs
+    logs.init_app(app)
+    startup_profile.mark("logging")
+
+    from app.cache import result_cache
+    result_cache.configure(
+        maxsize=app.config.get("CACHE_MAX_ENTRIES", 256),
+        ttl=app.config.get("CACHE_TTL_SECONDS", 60),
+    )
+
+    from app.billing import bill_renderer
+    bill_renderer.configure(
+        cache_dir=app.config.get("BILL_CACHE_DIR") or os.path.join(app.instance_path, "bills"),
+        max_workers=app.config.get("BILL_RENDER_WORKERS", 2),
+        max_bytes=app.config.get("BILL_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+        max_age=app.config.get("BILL_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600),
+    )
+
+    from app.scheduler import service_scheduler
+    service_scheduler.configure(
+        bays=app.config.get("SERVICE_BAYS", 4),
+        slot_minutes=app.config.get("SERVICE_SLOT_MINUTES", 15),
+        open_hour=app.config.get("SERVICE_OPEN_HOUR", 8),
+        close_hour=app.config.get("SERVICE_CLOSE_HOUR", 18),
+        default_duration=app.config.get("SERVICE_DEFAULT_DURATION", 60),
+        package_durations=app.config.get("SERVICE_PACKAGE_DURATIONS"),
+        max_age=app.config.get("SERVICE_INDEX_MAX_AGE", 30),
+    )
+
+    from app.search import inventory_index
+    inventory_index.configure(max_age=app.config.get("SEARCH_INDEX_MAX_AGE", 300))
+
+    from app.analytics import sales_analytics
+    sales_analytics.configure(
+        snapshot_dir=app.config.get("ANALYTICS_SNAPSHOT_DIR"),
+        refresh_seconds=app.config.get("ANALYTICS_REFRESH_SECONDS", 300),
+        lookback_days=app.config.get("ANALYTICS_LOOKBACK_DAYS", 31),
+    )
+
+    from app import metrics
+    metrics.init_app(app)
+
+    from app import nplusone
+    nplusone.init_app(app)
+
+    from app import outbox
+    outbox.init_app(app)
+
+    routing.init_app(app)
+    startup_profile.mark("services")
 
     from app.routes import bp as routes_bp
     app.register_blueprint(routes_bp)
 
-    return app
\ No newline at end of file
+    from app.api import api_bp
+    app.register_blueprint(api_bp)
+    startup_profile.mark("blueprints")
+
+    # Configure mappers at boot rather than in whichever request first uses the ORM
+    configure_mappers()
+    startup_profile.mark("mappers")
+
+    from app.rollup import rebuild_sales_rollup_command
+    app.cli.add_command(rebuild_sales_rollup_command)
+
+    from app.schema import migrate_indexes_command, ensure_schema_command
+    app.cli.add_command(migrate_indexes_command)
+    app.cli.add_command(ensure_schema_command)
+
+    from app.export import export_data_command
+    app.cli.add_command(export_data_command)
+
+    from app.analytics import refresh_analytics_command
+    app.cli.add_command(refresh_analytics_command)
+
+    from app.outbox import outbox_worker_command, purge_outbox_command, replay_outbox_command
+    app.cli.add_command(outbox_worker_command)
+    app.cli.add_command(replay_outbox_command)
+    app.cli.add_command(purge_outbox_command)
+
+    from app.routing import sync_replicas_command
+    app.cli.add_command(sync_replicas_command)
+
+    from app.startup import startup_profile_command
+    app.cli.add_command(startup_profile_command)
+    startup_profile.mark("cli commands")
+
+    return app
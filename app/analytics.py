@@ -0,0 +1,382 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.models import db, Customer, Vehicle
+from app.utils import lazy_import
+
+# NumPy is loaded on first use, so workers that never serve analytics skip it
+np = lazy_import('numpy')
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), 'car_dealership_analytics')
+EPOCH = date(1970, 1, 1)
+FETCH_BATCH_SIZE = 10_000
+ROLLING_WINDOWS = (7, 30)
+
+# Snapshot column -> dtype; rows are kept sorted by sold_day
+COLUMNS = {
+    'vehicle_id': 'int64',
+    'owner_id': 'int64',
+    'sold_day': 'int32',  # days since 1970-01-01
+    'year': 'int16',  # 0 when unknown
+    'sale_price': 'float64',
+    'profit': 'float64',
+}
+
+
+def to_day(value):
+    return (value - EPOCH).days
+
+
+def from_day(day):
+    return EPOCH + timedelta(days=int(day))
+
+
+class Snapshot:
+    """One read-only generation of the sold-vehicle fact columns, memory-mapped."""
+
+    def __init__(self, path, meta):
+        self.meta = meta
+        self.generation = meta['generation']
+        mmap_mode = 'r' if meta['rows'] else None  # empty files cannot be mapped
+        self.columns = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in COLUMNS
+        }
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def day_range(self):
+        days = self.columns['sold_day']
+        return (int(days[0]), int(days[-1])) if len(days) else None
+
+    def window(self, start_day, end_day):
+        """Return column views for sales between two days inclusive (a slice, no copy)."""
+        days = self.columns['sold_day']
+        lo = np.searchsorted(days, start_day, side='left')
+        hi = np.searchsorted(days, end_day, side='right')
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+
+def monthly_report(snapshot, start_day, end_day):
+    """Cars sold, revenue and profit per calendar month, with month-over-month profit change."""
+    rows = snapshot.window(start_day, end_day)
+    if not len(rows['sold_day']):
+        return []
+    months = rows['sold_day'].astype('datetime64[D]').astype('datetime64[M]')
+    first = months[0]
+    bucket = (months - first).astype(np.int64)
+    size = int(bucket[-1]) + 1
+    cars = np.bincount(bucket, minlength=size)
+    revenue = np.bincount(bucket, weights=rows['sale_price'], minlength=size)
+    profit = np.bincount(bucket, weights=rows['profit'], minlength=size)
+    report = []
+    for index in range(size):
+        previous = profit[index - 1] if index else 0.0
+        report.append({
+            'month': str(first + index),
+            'cars_sold': int(cars[index]),
+            'revenue': round(float(revenue[index]), 2),
+            'profit': round(float(profit[index]), 2),
+            'profit_change': round(float((profit[index] - previous) / abs(previous)), 4) if previous else None,
+        })
+    return report
+
+
+def margin_by_year_report(snapshot, start_day, end_day):
+    """Distribution of profit margin (profit / sale price) per model year."""
+    rows = snapshot.window(start_day, end_day)
+    valid = (rows['sale_price'] > 0) & (rows['year'] > 0)
+    years = rows['year'][valid]
+    margins = rows['profit'][valid] / rows['sale_price'][valid]
+    if not len(years):
+        return []
+    order = np.lexsort((margins, years))
+    years, margins = years[order], margins[order]
+    unique_years, starts, counts = np.unique(years, return_index=True, return_counts=True)
+    means = np.add.reduceat(margins, starts) / counts
+    report = []
+    for year, start, count, mean in zip(unique_years, starts, counts, means):
+        group = margins[start:start + count]  # already sorted
+        p25, median, p75 = np.quantile(group, (0.25, 0.5, 0.75))
+        report.append({
+            'year': int(year),
+            'cars_sold': int(count),
+            'mean_margin': round(float(mean), 4),
+            'min_margin': round(float(group[0]), 4),
+            'p25_margin': round(float(p25), 4),
+            'median_margin': round(float(median), 4),
+            'p75_margin': round(float(p75), 4),
+            'max_margin': round(float(group[-1]), 4),
+        })
+    return report
+
+
+def top_customers_report(snapshot, start_day, end_day, limit=10):
+    """Customers ranked by the profit of their purchases in the range."""
+    rows = snapshot.window(start_day, end_day)
+    if not len(rows['owner_id']):
+        return []
+    owners, inverse = np.unique(rows['owner_id'], return_inverse=True)
+    profit = np.bincount(inverse, weights=rows['profit'])
+    spent = np.bincount(inverse, weights=rows['sale_price'])
+    cars = np.bincount(inverse)
+    top = np.argsort(profit, kind='stable')[::-1][:limit]
+    ids = [int(owner) for owner in owners[top]]
+    names = dict(
+        (row.customer_id, f"{row.first_name} {row.last_name}")
+        for row in db.session.execute(
+            db.select(Customer.customer_id, Customer.first_name, Customer.last_name)
+            .where(Customer.customer_id.in_(ids))
+        )
+    )
+    return [
+        {
+            'customer_id': customer_id,
+            'name': names.get(customer_id),
+            'cars_bought': int(cars[index]),
+            'total_spent': round(float(spent[index]), 2),
+            'total_profit': round(float(profit[index]), 2),
+        }
+        for customer_id, index in zip(ids, top)
+    ]
+
+
+def rolling_report(snapshot, start_day, end_day):
+    """Daily profit and cars sold with trailing 7- and 30-day averages."""
+    if end_day < start_day:
+        return []
+    # Read back far enough that the first days of the range have full windows
+    lead = max(ROLLING_WINDOWS) - 1
+    rows = snapshot.window(start_day - lead, end_day)
+    offsets = rows['sold_day'].astype(np.int64) - (start_day - lead)
+    size = end_day - start_day + 1 + lead
+    profit = np.bincount(offsets, weights=rows['profit'], minlength=size)
+    cars = np.bincount(offsets, minlength=size).astype(np.float64)
+    profit_sums = np.concatenate(([0.0], np.cumsum(profit)))
+    car_sums = np.concatenate(([0.0], np.cumsum(cars)))
+    averages = {}
+    for window in ROLLING_WINDOWS:
+        ends = np.arange(lead + 1, size + 1)
+        averages[window] = (
+            (profit_sums[ends] - profit_sums[ends - window]) / window,
+            (car_sums[ends] - car_sums[ends - window]) / window,
+        )
+    report = []
+    for index in range(size - lead):
+        entry = {
+            'date': from_day(start_day + index).isoformat(),
+            'profit': round(float(profit[lead + index]), 2),
+            'cars_sold': int(cars[lead + index]),
+        }
+        for window, (profit_avg, cars_avg) in averages.items():
+            entry[f'profit_avg_{window}d'] = round(float(profit_avg[index]), 2)
+            entry[f'cars_avg_{window}d'] = round(float(cars_avg[index]), 3)
+        report.append(entry)
+    return report
+
+
+REPORT_FUNCTIONS = {
+    'monthly': monthly_report,
+    'margin_by_year': margin_by_year_report,
+    'top_customers': top_customers_report,
+    'rolling': rolling_report,
+}
+
+
+class SalesAnalytics:
+    """Sales reports computed with NumPy over a memory-mapped snapshot.
+
+    The snapshot holds one row per sold vehicle in column files under
+    snapshot_dir/gen-NNNNNN, with meta.json naming the current generation.
+    A refresh re-reads only vehicles sold in the last lookback_days (by
+    sold_at) and merges them into a new generation; `flask refresh-analytics
+    --full` rebuilds from scratch, catching older back-dated sales. Worker
+    processes share the files, and a file lock keeps refreshes serial.
+    Once a snapshot exists, a stale one is refreshed on a background thread
+    and requests keep reading the previous generation until it is swapped in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.configure()
+
+    def configure(self, snapshot_dir=None, refresh_seconds=300, lookback_days=31):
+        with self._lock:
+            self.snapshot_dir = snapshot_dir or DEFAULT_SNAPSHOT_DIR
+            self.refresh_seconds = refresh_seconds
+            self.lookback_days = lookback_days
+            self._snapshot = None
+
+    def _generation_path(self, generation):
+        return os.path.join(self.snapshot_dir, f'gen-{generation:06d}')
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.snapshot_dir, 'meta.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(os.path.join(self.snapshot_dir, 'refresh.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stale(self, meta):
+        return meta is None or time.time() - meta['refreshed_at'] >= self.refresh_seconds
+
+    def _fetch(self, since=None):
+        """Read sold vehicles (optionally sold on or after a date) into column arrays."""
+        query = db.select(
+            Vehicle.vehicle_id, Vehicle.owner_id, Vehicle.sold_at, Vehicle.year,
+            db.type_coerce(Vehicle.sale_price, db.Float), db.type_coerce(Vehicle.profit, db.Float),
+        ).where(Vehicle.sold_at.isnot(None)).order_by(Vehicle.sold_at, Vehicle.vehicle_id)
+        if since is not None:
+            query = query.where(Vehicle.sold_at >= since)
+        values = {name: [] for name in COLUMNS}
+        result = db.session.connection().execution_options(yield_per=FETCH_BATCH_SIZE).execute(query)
+        for vehicle_id, owner_id, sold_at, year, sale_price, profit in result:
+            values['vehicle_id'].append(vehicle_id)
+            values['owner_id'].append(owner_id)
+            values['sold_day'].append(to_day(sold_at))
+            values['year'].append(year or 0)
+            values['sale_price'].append(sale_price or 0.0)
+            values['profit'].append(profit or 0.0)
+        return {name: np.array(values[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def refresh(self, full=False, only_if_stale=False):
+        """Write a new snapshot generation and return its metadata.
+
+        With only_if_stale, the current metadata is returned unchanged when
+        another process refreshed recently enough.
+        """
+        with self._file_lock():
+            start = time.perf_counter()
+            meta = self._read_meta()
+            if only_if_stale and not self._stale(meta):
+                return meta
+            if full:
+                meta = None
+            if meta is None:
+                columns = self._fetch()
+            else:
+                # Re-read the recent window so late-entered and repeated sales replace old rows
+                high_water = min(meta['high_water_day'], to_day(date.today()))
+                cutoff = high_water - self.lookback_days
+                fresh = self._fetch(since=from_day(cutoff))
+                old = Snapshot(self._generation_path(meta['generation']), meta).columns
+                keep = (old['sold_day'] < cutoff) & ~np.isin(old['vehicle_id'], fresh['vehicle_id'])
+                columns = {name: np.concatenate((old[name][keep], fresh[name])) for name in COLUMNS}
+
+            generation = (meta['generation'] + 1) if meta else self._next_generation()
+            path = self._generation_path(generation)
+            os.makedirs(path, exist_ok=True)
+            for name, column in columns.items():
+                np.save(os.path.join(path, f'{name}.npy'), column)
+            rows = len(columns['sold_day'])
+            new_meta = {
+                'generation': generation,
+                'rows': rows,
+                'high_water_day': int(columns['sold_day'][-1]) if rows else to_day(date.today()),
+                'refreshed_at': time.time(),
+                'full': meta is None,
+            }
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(new_meta, f)
+            os.replace(tmp_path, os.path.join(self.snapshot_dir, 'meta.json'))
+            self._remove_old_generations(generation)
+        logging.info(
+            f"Analytics snapshot generation {generation} written: {rows} sales "
+            f"({'full' if new_meta['full'] else 'incremental'}) in {time.perf_counter() - start:.3f}s"
+        )
+        return new_meta
+
+    def _next_generation(self):
+        existing = [int(name[4:]) for name in os.listdir(self.snapshot_dir) if name.startswith('gen-')]
+        return max(existing, default=0) + 1
+
+    def _remove_old_generations(self, current):
+        # Keep the previous generation for readers that mapped it before the swap
+        for name in os.listdir(self.snapshot_dir):
+            if name.startswith('gen-') and int(name[4:]) < current - 1:
+                shutil.rmtree(os.path.join(self.snapshot_dir, name), ignore_errors=True)
+
+    def snapshot(self):
+        """Return the current snapshot, starting a background refresh if older than refresh_seconds.
+
+        Only the very first snapshot, when none exists on disk, is built in
+        the calling request.
+        """
+        with self._lock:
+            current = self._snapshot
+            if current is not None and not self._stale(current.meta):
+                return current
+        meta = self._read_meta()
+        if meta is None:
+            meta = self.refresh(only_if_stale=True)
+        elif self._stale(meta):
+            self._refresh_in_background(current_app._get_current_object())
+        with self._lock:
+            if self._snapshot is None or self._snapshot.generation != meta['generation']:
+                self._snapshot = Snapshot(self._generation_path(meta['generation']), meta)
+            return self._snapshot
+
+    def _refresh_in_background(self, app):
+        """Start one refresh thread unless one is already running in this process."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, args=(app,),
+                         name='analytics-refresh', daemon=True).start()
+
+    def _background_refresh(self, app):
+        try:
+            with app.app_context():
+                self.refresh(only_if_stale=True)
+        except Exception as e:
+            logging.error(f"Analytics snapshot refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def report(self, name, start_date=None, end_date=None, **options):
+        """Run a named report over an inclusive date range (default: all sales)."""
+        snapshot = self.snapshot()
+        bounds = snapshot.day_range()
+        if bounds is None:
+            return []
+        start_day = to_day(start_date) if start_date else bounds[0]
+        end_day = to_day(end_date) if end_date else bounds[1]
+        return REPORT_FUNCTIONS[name](snapshot, start_day, end_day, **options)
+
+
+sales_analytics = SalesAnalytics()
+
+
+@click.command('refresh-analytics')
+@click.option('--full', is_flag=True, help="Rebuild the snapshot from every sold vehicle.")
+@with_appcontext
+def refresh_analytics_command(full):
+    """Write a new analytics snapshot generation."""
+    meta = sales_analytics.refresh(full=full)
+    click.echo(f"Analytics snapshot generation {meta['generation']}: {meta['rows']} sales.")
@@ -0,0 +1,205 @@
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import Blueprint, jsonify, request
+
+from app.analytics import sales_analytics, REPORT_FUNCTIONS
+from app.models import db, Customer, Vehicle, ServiceAppointment, ServicePackage, SalesStats
+from app.repository import with_collections
+from app.routing import read_only
+from app.utils import to_json_value
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Resource name -> (model, primary key column)
+RESOURCES = {
+    'customers': (Customer, Customer.customer_id),
+    'vehicles': (Vehicle, Vehicle.vehicle_id),
+    'appointments': (ServiceAppointment, ServiceAppointment.appt_id),
+    'packages': (ServicePackage, ServicePackage.pkg_id),
+    'sales_stats': (SalesStats, SalesStats.stats_id),
+}
+
+# Collections that ?expand= may attach to each item, per resource
+EXPANSIONS = {
+    'customers': ('vehicles', 'appointments'),
+    'vehicles': ('appointments', 'sales_stats'),
+}
+
+
+class ApiError(Exception):
+    """Raised for invalid API requests; rendered as a JSON error body."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({"error": error.message}), error.status
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps({"k": key}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ApiError("Invalid cursor.")
+    if not isinstance(key, int):
+        raise ApiError("Invalid cursor.")
+    return key
+
+
+def selected_columns(model):
+    """Resolve the ?fields= parameter to table columns, always including the primary key."""
+    columns = model.__table__.columns
+    requested = request.args.get('fields')
+    if not requested:
+        return list(columns)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    pk_names = [column.name for column in model.__table__.primary_key]
+    return [columns[name] for name in pk_names + [n for n in names if n not in pk_names]]
+
+
+def requested_expansions(resource):
+    """Resolve the ?expand= parameter to relationship names allowed for the resource."""
+    requested = request.args.get('expand')
+    if not requested:
+        return []
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in EXPANSIONS.get(resource, ())]
+    if unknown:
+        raise ApiError(f"Cannot expand: {', '.join(unknown)}")
+    return names
+
+
+def expand_items(data, model, pk, names):
+    """Attach the named collections to each item with one IN query per collection."""
+    if not names or not data:
+        return
+    objects = with_collections(model, [item[pk.name] for item in data], names)
+    for item in data:
+        obj = objects.get(item[pk.name])
+        for name in names:
+            item[name] = [
+                {column.name: to_json_value(getattr(child, column.key)) for column in child.__table__.columns}
+                for child in (getattr(obj, name) if obj is not None else [])
+            ]
+
+
+def conditional_json(payload):
+    """Build a JSON response with a content ETag, answering If-None-Match with 304."""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f"Unknown resource: {name}", 404)
+    return resource
+
+
+@api_bp.route('/<resource>', methods=['GET'])
+@read_only
+def list_resource(resource):
+    """Page through a resource in primary key order using keyset cursors.
+
+    Each page is a single indexed range scan (pk > cursor ORDER BY pk LIMIT n),
+    so the cost per page does not grow with the table size. ?expand= adds one
+    IN query per collection for the whole page.
+    """
+    model, pk = get_resource(resource)
+    expansions = requested_expansions(resource)
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    columns = selected_columns(model)
+
+    query = db.select(*columns).order_by(pk).limit(limit + 1)
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.where(pk > decode_cursor(cursor))
+
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = [
+        {column.name: to_json_value(value) for column, value in zip(columns, row)}
+        for row in rows
+    ]
+    expand_items(data, model, pk, expansions)
+
+    next_cursor = encode_cursor(getattr(rows[-1], pk.key)) if has_more else None
+    links = {}
+    if next_cursor:
+        # Built from the query string as-is: passing it to url_for breaks on keys like resource=
+        params = [(key, value) for key, value in request.args.items(multi=True) if key != 'cursor']
+        links["next"] = f"{request.script_root}{request.path}?{urlencode(params + [('cursor', next_cursor)])}"
+    return conditional_json({"data": data, "next_cursor": next_cursor, "links": links})
+
+
+@api_bp.route('/<resource>/<int:item_id>', methods=['GET'])
+@read_only
+def get_item(resource, item_id):
+    """Fetch a single record by primary key."""
+    model, pk = get_resource(resource)
+    expansions = requested_expansions(resource)
+    columns = selected_columns(model)
+    row = db.session.execute(db.select(*columns).where(pk == item_id)).first()
+    if row is None:
+        raise ApiError("Not found.", 404)
+    data = {column.name: to_json_value(value) for column, value in zip(columns, row)}
+    expand_items([data], model, pk, expansions)
+    return conditional_json({"data": data})
+
+
+def parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ApiError(f"{name} must be YYYY-MM-DD.")
+
+
+@api_bp.route('/analytics/<report>', methods=['GET'])
+@read_only
+def analytics_report(report):
+    """Serve a sales report (monthly, margin_by_year, top_customers, rolling) from the snapshot."""
+    if report not in REPORT_FUNCTIONS:
+        raise ApiError(f"Unknown report: {report}", 404)
+    start_date, end_date = parse_date_arg('start_date'), parse_date_arg('end_date')
+    options = {}
+    if report == 'top_customers':
+        try:
+            options['limit'] = max(1, min(int(request.args.get('limit', 10)), 100))
+        except ValueError:
+            raise ApiError("limit must be an integer.")
+    data = sales_analytics.report(report, start_date, end_date, **options)
+    snapshot = sales_analytics.snapshot()
+    return conditional_json({
+        "report": report,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "snapshot": {"generation": snapshot.generation, "rows": len(snapshot)},
+        "data": data,
+    })
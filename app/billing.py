@@ -0,0 +1,340 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils import lazy_import
+
+# ReportLab is loaded when the first bill is drawn, not at import
+canvas = lazy_import('reportlab.pdfgen.canvas')
+
+SALE_BILL = 'bill'
+SERVICE_BILL = 'service_bill'
+EXPORT_CHUNK_SIZE = 64 * 1024
+PRUNE_INTERVAL_SECONDS = 60
+# A job item with no PDF or failure marker after this long is reported as failed
+JOB_TIMEOUT_SECONDS = 300
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+# Files the cache directory holds: bills, their failure markers and job manifests
+CACHE_SUFFIXES = ('.pdf', '.failed', '.json')
+
+
+def sale_bill_data(vehicle, customer):
+    """Prepare the fields printed on a car sale bill."""
+    return {
+        "customer_name": f"{customer.first_name} {customer.last_name}",
+        "customer_phone": customer.phone or "N/A",
+        "customer_email": customer.email or "N/A",
+        "vehicle_make": vehicle.make,
+        "vehicle_model": vehicle.model,
+        "vehicle_year": vehicle.year,
+        "vehicle_vin": vehicle.vin,
+        "sale_price": f"${vehicle.sale_price:.2f}" if vehicle.sale_price else "N/A",
+        "sale_date": vehicle.sold_at.strftime('%Y-%m-%d') if vehicle.sold_at else "N/A",
+        "profit": f"${vehicle.profit:.2f}" if vehicle.profit else "N/A",
+    }
+
+
+def service_bill_data(appointment, customer, vehicle):
+    """Prepare the fields printed on a service bill."""
+    return {
+        "customer_name": f"{customer.first_name} {customer.last_name}",
+        "customer_phone": customer.phone or "N/A",
+        "customer_email": customer.email or "N/A",
+        "vehicle_details": f"{vehicle.make} {vehicle.model} ({vehicle.year})",
+        "appt_date": appointment.appt_date.strftime('%Y-%m-%d'),
+        "arrival_time": appointment.arrival_time.strftime('%H:%M'),
+        "completion_time": appointment.completion_time.strftime('%H:%M') if appointment.completion_time else "N/A",
+        "total_cost": f"${appointment.total_cost:.2f}" if appointment.total_cost else "N/A",
+    }
+
+
+def draw_sale_bill(c, bill_data):
+    """Draw one car sale bill onto the current canvas page."""
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(100, 800, "Car Dealership Bill")
+    c.setFont("Helvetica", 12)
+    c.drawString(100, 770, f"Customer Name: {bill_data['customer_name']}")
+    c.drawString(100, 750, f"Phone: {bill_data['customer_phone']}")
+    c.drawString(100, 730, f"Email: {bill_data['customer_email']}")
+    c.drawString(100, 710, f"Vehicle: {bill_data['vehicle_make']} {bill_data['vehicle_model']} ({bill_data['vehicle_year']})")
+    c.drawString(100, 690, f"VIN: {bill_data['vehicle_vin']}")
+    c.drawString(100, 670, f"Sale Price: {bill_data['sale_price']}")
+    c.drawString(100, 650, f"Sale Date: {bill_data['sale_date']}")
+    c.drawString(100, 630, f"Profit: {bill_data['profit']}")
+    c.drawString(100, 600, "Thank you for your business!")
+
+
+def draw_service_bill(c, bill_data):
+    """Draw one service bill onto the current canvas page."""
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(100, 800, "Car Dealership Service Bill")
+    c.setFont("Helvetica", 12)
+    c.drawString(100, 770, f"Customer Name: {bill_data['customer_name']}")
+    c.drawString(100, 750, f"Phone: {bill_data['customer_phone']}")
+    c.drawString(100, 730, f"Email: {bill_data['customer_email']}")
+    c.drawString(100, 710, f"Vehicle: {bill_data['vehicle_details']}")
+    c.drawString(100, 690, f"Appointment Date: {bill_data['appt_date']}")
+    c.drawString(100, 670, f"Arrival Time: {bill_data['arrival_time']}")
+    c.drawString(100, 650, f"Completion Time: {bill_data['completion_time']}")
+    c.drawString(100, 630, f"Total Cost: {bill_data['total_cost']}")
+    c.drawString(100, 600, "Thank you for your business!")
+
+
+DRAWERS = {SALE_BILL: draw_sale_bill, SERVICE_BILL: draw_service_bill}
+
+
+def render_pdf(kind, bill_data, path):
+    """Render a bill to path, writing a temp file first so readers never see a partial PDF.
+
+    Runs inside the worker processes, so it must stay a picklable module-level function.
+    A failed render leaves a <path>.failed marker so any process can report it.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        c = canvas.Canvas(tmp_path)
+        DRAWERS[kind](c, bill_data)
+        c.save()
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        open(f"{path}.failed", 'w').close()
+        raise
+    try:
+        os.remove(f"{path}.failed")
+    except FileNotFoundError:
+        pass
+    return path
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only sink that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_sale_bills_zip(rows):
+    """Stream a ZIP archive with one PDF per (vehicle, customer) row.
+
+    Each bill is rendered, compressed and yielded before the next row is
+    read, so memory does not grow with the number of bills.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for vehicle, customer in rows:
+            pdf = io.BytesIO()
+            c = canvas.Canvas(pdf)
+            draw_sale_bill(c, sale_bill_data(vehicle, customer))
+            c.save()
+            archive.writestr(f"bill_{vehicle.vehicle_id}.pdf", pdf.getvalue())
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def iter_sale_bills_pdf(rows):
+    """Yield one multi-page PDF with a sale bill per (vehicle, customer) row.
+
+    This does not stream: ReportLab keeps every page in memory until save,
+    so memory grows with the number of bills and nothing is yielded until
+    the last one is drawn. The saved file is then sent in fixed-size
+    chunks. export_bills caps it at BILL_PDF_MAX_BILLS; larger ranges
+    should use iter_sale_bills_zip, which streams.
+    """
+    with tempfile.TemporaryFile() as spool:
+        c = canvas.Canvas(spool)
+        for vehicle, customer in rows:
+            draw_sale_bill(c, sale_bill_data(vehicle, customer))
+            c.showPage()
+        c.save()
+        spool.seek(0)
+        while True:
+            chunk = spool.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+class BillRenderer:
+    """Renders bills in a process pool and caches the PDFs on disk by content hash.
+
+    Identical bill data always maps to the same file, so repeat downloads are
+    served straight from disk and concurrent requests share one render. The
+    cache holds customer details, so it lives in a private directory (the
+    app's instance folder by default) and is pruned: files unused for
+    max_age seconds go first, then the least recently used until the cache
+    is under max_bytes.
+
+    Batch jobs are JSON manifests in the same directory, and an item's
+    status comes from whether its PDF (or failure marker) exists, so any
+    worker process sharing cache_dir can report on a job another started.
+    """
+
+    def __init__(self, cache_dir=None, max_workers=2, max_bytes=512 * 1024 * 1024,
+                 max_age=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def configure(self, cache_dir, max_workers, max_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.shutdown()
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            self._pending.clear()
+
+    def path_for(self, kind, bill_data):
+        """Return the content-addressed cache path for a bill."""
+        digest = hashlib.sha256(json.dumps([kind, bill_data], sort_keys=True, default=str).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{kind}_{digest}.pdf")
+
+    def submit(self, kind, bill_data):
+        """Schedule a render unless the PDF is cached; returns (path, future or None)."""
+        path = self.path_for(kind, bill_data)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # mtime doubles as last use for pruning
+            except OSError:
+                pass
+            return path, None
+        self.maybe_prune()
+        with self._lock:
+            future = self._pending.get(path)
+            created = future is None
+            if created:
+                os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                future = self._executor.submit(render_pdf, kind, bill_data, path)
+                self._pending[path] = future
+        if created:
+            # Outside the lock: the callback runs inline if the render already finished
+            future.add_done_callback(lambda f, path=path: self._forget(path, f))
+        return path, future
+
+    def _forget(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+    def maybe_prune(self):
+        """Prune the cache if it has not been pruned in the last PRUNE_INTERVAL_SECONDS."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+                return
+            self._pruned_at = now
+        self.prune()
+
+    def prune(self):
+        """Delete expired bills, then the least recently used until under max_bytes; returns the count."""
+        with self._lock:
+            pending = set(self._pending)
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(CACHE_SUFFIXES) and entry.path not in pending:
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        expired_before = time.time() - self.max_age
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= expired_before and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def render(self, kind, bill_data, timeout=30):
+        """Return the path of a rendered bill, waiting for the pool if needed."""
+        path, future = self.submit(kind, bill_data)
+        if future is not None:
+            future.result(timeout=timeout)
+        return path
+
+    def _manifest_path(self, job_id):
+        return os.path.join(self.cache_dir, f"job_{job_id}.json")
+
+    def start_job(self, items):
+        """Queue a batch of (kind, name, bill_data) renders and return a job id."""
+        job_id = uuid.uuid4().hex
+        entries = []
+        for kind, name, bill_data in items:
+            path, _ = self.submit(kind, bill_data)
+            entries.append({"name": name, "file": os.path.basename(path)})
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as manifest:
+            json.dump({"created_at": time.time(), "items": entries}, manifest)
+        os.replace(tmp_path, self._manifest_path(job_id))
+        return job_id
+
+    def job_status(self, job_id):
+        """Return per-item render status for a job, or None if it is unknown."""
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._manifest_path(job_id)) as manifest:
+                job = json.load(manifest)
+        except FileNotFoundError:
+            return None
+        timed_out = time.time() - job["created_at"] > JOB_TIMEOUT_SECONDS
+        items = []
+        for entry in job["items"]:
+            path = os.path.join(self.cache_dir, entry["file"])
+            if os.path.exists(path):
+                status = "done"
+            elif timed_out or os.path.exists(f"{path}.failed"):
+                status = "failed"
+            else:
+                status = "pending"
+            items.append({"name": entry["name"], "status": status})
+        return {
+            "job_id": job_id,
+            "done": all(item["status"] != "pending" for item in items),
+            "items": items,
+        }
+
+
+bill_renderer = BillRenderer()
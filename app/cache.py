@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL.
+
+    Keys are tuples whose first element is a namespace, so related entries
+    (e.g. every cached statistics range) can be invalidated together.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl):
+        """Resize the cache and change the TTL, dropping all current entries."""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key, default=None):
+        """Return a live entry and mark it most recently used."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries when full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, factory):
+        """Return the cached value for key, computing and storing it on a miss.
+
+        If the namespace is invalidated while the factory runs, the freshly
+        computed value may already be stale and is returned without caching.
+        """
+        missing = object()
+        generation = self._generations.get(key[0], 0)
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            with self._lock:
+                stale = self._generations.get(key[0], 0) != generation
+            if not stale:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, namespace):
+        """Drop every entry whose key starts with the given namespace."""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key in self._data if key[0] == namespace]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+result_cache = TTLCache()
+
+SALES_STATISTICS = 'sales_statistics'
+SERVICE = 'service'
+
+
+def invalidate_service():
+    """Forget cached service lookups after a package or appointment changes."""
+    result_cache.invalidate(SERVICE)
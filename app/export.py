@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import sys
+import zlib
+
+import click
+from flask.cli import with_appcontext
+
+from app.models import db, Customer, Vehicle
+from app.utils import to_json_value
+
+EXPORT_BATCH_SIZE = 1000
+DATASETS = ('vehicles', 'customers', 'sales')
+FORMATS = ('csv', 'ndjson')
+
+
+def dataset_query(name):
+    """Return the Core column select for an export dataset, or None if unknown."""
+    if name == 'vehicles':
+        return db.select(*Vehicle.__table__.columns).order_by(Vehicle.vehicle_id)
+    if name == 'customers':
+        return db.select(*Customer.__table__.columns).order_by(Customer.customer_id)
+    if name == 'sales':
+        return db.select(
+            Vehicle.vehicle_id, Vehicle.sold_at, Vehicle.make, Vehicle.model, Vehicle.year,
+            Vehicle.vin, Vehicle.purchase_price, Vehicle.sale_price, Vehicle.profit,
+            Customer.customer_id, Customer.first_name, Customer.last_name,
+        ).join(
+            Customer, Vehicle.owner_id == Customer.customer_id
+        ).where(Vehicle.sold_at.isnot(None)).order_by(Vehicle.sold_at, Vehicle.vehicle_id)
+    return None
+
+
+def iter_batches(query):
+    """Yield (column names, row batch) pairs using a server-side cursor.
+
+    The connection is held only while the generator runs, and rows are
+    fetched EXPORT_BATCH_SIZE at a time, so memory is bounded by one batch.
+    """
+    # Ask the session for its bind so exports from read-only endpoints stream from a replica
+    with db.session.get_bind().connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(query)
+        columns = list(result.keys())
+        empty = True
+        for batch in result.partitions():
+            empty = False
+            yield columns, batch
+        if empty:
+            yield columns, []
+
+
+def iter_csv(batches):
+    """Encode row batches as CSV, one chunk per batch, with a header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, batch in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_ndjson(batches):
+    """Encode row batches as newline-delimited JSON, one chunk per batch."""
+    for columns, batch in batches:
+        if not batch:
+            continue
+        lines = [
+            json.dumps({column: to_json_value(value) for column, value in zip(columns, row)})
+            for row in batch
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_gzip(chunks):
+    """Compress a stream of byte chunks into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, export_format='csv', compress=False):
+    """Return a generator of encoded chunks for a dataset export."""
+    batches = iter_batches(dataset_query(name))
+    chunks = iter_csv(batches) if export_format == 'csv' else iter_ndjson(batches)
+    return iter_gzip(chunks) if compress else chunks
+
+
+@click.command('export-data')
+@click.argument('dataset', type=click.Choice(DATASETS))
+@click.option('--format', 'export_format', type=click.Choice(FORMATS), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help="Gzip the output.")
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help="File to write (default: stdout).")
+@with_appcontext
+def export_data_command(dataset, export_format, compress, output):
+    """Stream a dataset to a file or stdout as CSV or NDJSON."""
+    stream = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in stream_export(dataset, export_format, compress):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
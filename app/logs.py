@@ -0,0 +1,164 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+_listeners = []
+_installed = []
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "method", "path"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the request ID, method and path onto records in the calling thread."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in every N INFO records whose message starts with a sampled prefix.
+
+    Warnings and errors, and INFO records not matching a prefix, always pass.
+    """
+
+    def __init__(self, prefixes, every):
+        super().__init__()
+        self.prefixes = tuple(prefixes)
+        self.every = max(int(every), 1)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.INFO or self.every == 1 or not isinstance(record.msg, str):
+            return True
+        prefix = next((p for p in self.prefixes if record.msg.startswith(p)), None)
+        if prefix is None:
+            return True
+        with self._lock:
+            count = self._counts.get(prefix, 0)
+            self._counts[prefix] = count + 1
+        return count % self.every == 0
+
+
+def async_handler(target):
+    """Wrap a handler so callers only enqueue records; a listener thread does the I/O."""
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return logging.handlers.QueueHandler(records)
+
+
+def file_handler(config, path):
+    """Build a file handler for path according to the LOG_ROTATION settings.
+
+    'size' and 'time' rotate in-process, which is only safe when a single
+    process writes the file: several processes rotating one file lose and
+    clobber records. 'external' (the production default) appends through a
+    WatchedFileHandler, which reopens the file after logrotate or similar
+    has moved it, so any number of workers can share it.
+    """
+    rotation = config.get('LOG_ROTATION', 'size')
+    if rotation == 'external':
+        handler = logging.handlers.WatchedFileHandler(path, delay=True)
+    elif rotation == 'time':
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=config.get('LOG_ROTATE_WHEN', 'midnight'),
+            backupCount=config.get('LOG_BACKUP_COUNT', 7), delay=True,
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=config.get('LOG_BACKUP_COUNT', 7), delay=True,
+        )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def attach(logger, handler, filters=()):
+    """Install a queue-backed handler on logger, replacing any installed earlier."""
+    for installed_logger, installed in list(_installed):
+        if installed_logger is logger:
+            logger.removeHandler(installed)
+            _installed.remove((installed_logger, installed))
+    queue_handler = async_handler(handler)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    logger.addHandler(queue_handler)
+    _installed.append((logger, queue_handler))
+    return queue_handler
+
+
+def stop_listeners():
+    """Flush and stop all listener threads (registered with atexit)."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def _restart_listeners_in_child():
+    # Listener threads do not survive fork (gunicorn preload, process pools); start new
+    # listeners on the same queues, which the installed QueueHandlers still feed
+    for index, listener in enumerate(_listeners):
+        replacement = logging.handlers.QueueListener(
+            listener.queue, *listener.handlers, respect_handler_level=listener.respect_handler_level)
+        replacement.start()
+        _listeners[index] = replacement
+
+
+atexit.register(stop_listeners)
+os.register_at_fork(after_in_child=_restart_listeners_in_child)
+
+
+def init_app(app):
+    """Route application logging through a queue to a rotating JSON log file."""
+    while _installed:
+        logger, handler = _installed.pop()
+        logger.removeHandler(handler)
+    stop_listeners()
+    root = logging.getLogger()
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    attach(root, file_handler(app.config, app.config.get('LOG_FILE', 'app_logs.log')), filters=(
+        RequestContextFilter(),
+        SamplingFilter(app.config.get('LOG_SAMPLE_PREFIXES', ()), app.config.get('LOG_SAMPLE_EVERY', 1)),
+    ))
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def return_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
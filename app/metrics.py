@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import logs
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+slow_logger = logging.getLogger('car_dealership.slow_requests')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-local request, SQL and PDF render metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.request_latency = {}
+            self.request_total = {}
+            self.statements = {}
+            self.statement_seconds = {}
+            self.render_latency = {}
+
+    def _observe(self, table, labels, buckets, value):
+        histogram = table.get(labels)
+        if histogram is None:
+            histogram = table[labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def observe_request(self, endpoint, method, status, seconds, statements, statement_seconds):
+        with self._lock:
+            self._observe(self.request_latency, (endpoint, method), LATENCY_BUCKETS, seconds)
+            key = (endpoint, method, str(status))
+            self.request_total[key] = self.request_total.get(key, 0) + 1
+            self._observe(self.statements, (endpoint,), STATEMENT_BUCKETS, statements)
+            self.statement_seconds[(endpoint,)] = self.statement_seconds.get((endpoint,), 0.0) + statement_seconds
+
+    def observe_render(self, kind, seconds):
+        with self._lock:
+            self._observe(self.render_latency, (kind,), LATENCY_BUCKETS, seconds)
+
+    @contextmanager
+    def render_timer(self, kind):
+        """Time a PDF render and record it under the given bill kind."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_render(kind, time.perf_counter() - start)
+
+    def render_prometheus(self, extra=None):
+        """Serialise all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, 'http_request_duration_seconds', 'Request latency by endpoint.',
+                             ('endpoint', 'method'), self.request_latency)
+            _counter_lines(lines, 'http_requests_total', 'Requests by endpoint and status.',
+                           ('endpoint', 'method', 'status'), self.request_total)
+            _histogram_lines(lines, 'db_statements_per_request', 'SQL statements issued per request.',
+                             ('endpoint',), self.statements)
+            _counter_lines(lines, 'db_statement_seconds_total', 'Time spent executing SQL by endpoint.',
+                           ('endpoint',), self.statement_seconds)
+            _histogram_lines(lines, 'pdf_render_duration_seconds', 'Bill PDF render time.',
+                             ('kind',), self.render_latency)
+        for name, (help_text, metric_type, value) in (extra or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _histogram_lines(lines, name, help_text, label_names, table):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for values, histogram in sorted(table.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(label_names, values, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(label_names, values, [('le', '+Inf')])} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(label_names, values)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(label_names, values)} {histogram.count}")
+
+
+def _counter_lines(lines, name, help_text, label_names, table):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for values, value in sorted(table.items()):
+        lines.append(f"{name}{_labels(label_names, values)} {value}")
+
+
+metrics = MetricsRegistry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements.append((statement, elapsed))
+
+
+def init_app(app):
+    """Attach request timing, SQL tracking, the slow request log and /metrics."""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    threshold = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 500) / 1000.0
+    log_path = app.config.get('SLOW_REQUEST_LOG', 'slow_requests.log')
+    if log_path:
+        logs.attach(slow_logger, logs.file_handler(app.config, log_path),
+                    filters=(logs.RequestContextFilter(),))
+        slow_logger.setLevel(logging.INFO)
+        slow_logger.propagate = False
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.sql_statements = []
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        statements = g.get('sql_statements', [])
+        endpoint = request.endpoint or 'unmatched'
+        sql_seconds = sum(duration for _, duration in statements)
+        metrics.observe_request(endpoint, request.method, response.status_code,
+                                elapsed, len(statements), sql_seconds)
+        if elapsed >= threshold:
+            sql_lines = '\n'.join(f"    [{duration * 1000:.1f} ms] {statement}" for statement, duration in statements)
+            slow_logger.info(
+                f"{request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                f"in {elapsed * 1000:.1f} ms, {len(statements)} SQL statements "
+                f"({sql_seconds * 1000:.1f} ms)\n{sql_lines}"
+            )
+        return response
+
+    def metrics_endpoint():
+        from app.cache import result_cache
+        cache = result_cache.stats()
+        extra = {
+            'result_cache_hits_total': ("Result cache hits.", 'counter', cache['hits']),
+            'result_cache_misses_total': ("Result cache misses.", 'counter', cache['misses']),
+            'result_cache_entries': ("Entries in the result cache.", 'gauge', cache['size']),
+        }
+        from app.outbox import outbox_worker
+        outbox = outbox_worker.lag()
+        extra.update({
+            'outbox_lag_seconds': ("Age of the oldest unprocessed outbox event.", 'gauge', outbox['lag_seconds']),
+            'outbox_pending_events': ("Outbox events waiting for the worker.", 'gauge', outbox['pending']),
+            'outbox_parked_events': ("Outbox events that exhausted their attempts.", 'gauge', outbox['parked']),
+        })
+        from app.routing import replica_router
+        replicas = replica_router.status()
+        if replicas:
+            extra['db_replicas_healthy'] = (
+                "Read replicas currently serving reads.", 'gauge',
+                sum(1 for replica in replicas.values() if replica['healthy']),
+            )
+        return Response(metrics.render_prometheus(extra), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
@@ -1,7 +1,12 @@
+from sqlalchemy.orm import Session
+
 from app import db
+from app.cache import invalidate_service
 
 class Customer(db.Model):
     """Represents a customer in the database."""
+    __table_args__ = (db.Index('ix_customer_name', 'last_name', 'first_name'),)
+
     customer_id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(40), nullable=False)
     last_name = db.Column(db.String(40), nullable=False)
@@ -13,12 +18,17 @@ class Customer(db.Model):
     created_at = db.Column(db.Date)
     updated_at = db.Column(db.Date)
 
-    vehicles = db.relationship('Vehicle', backref='owner', cascade='all, delete-orphan')
-    appointments = db.relationship('ServiceAppointment', backref='customer', cascade='all, delete-orphan')
+    # back_populates rather than backref: both sides exist as soon as the classes
+    # are defined, so eager-load options like joinedload(Vehicle.owner) work in a
+    # process that has not configured its mappers yet
+    vehicles = db.relationship('Vehicle', back_populates='owner', cascade='all, delete-orphan')
+    appointments = db.relationship('ServiceAppointment', back_populates='customer', cascade='all, delete-orphan')
 
 
 class Vehicle(db.Model):
     """Represents a vehicle in the database."""
+    __table_args__ = (db.Index('ix_vehicle_make_model', 'make', 'model'),)
+
     vehicle_id = db.Column(db.Integer, primary_key=True)
     make = db.Column(db.String(40))
     model = db.Column(db.String(40))
@@ -27,27 +37,31 @@ class Vehicle(db.Model):
     purchase_price = db.Column(db.Numeric(10, 2))
     sale_price = db.Column(db.Numeric(10, 2))
     profit = db.Column(db.Numeric(10, 2))
-    owner_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), nullable=False)
-    sold_at = db.Column(db.Date)
+    owner_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), nullable=False, index=True)
+    sold_at = db.Column(db.Date, index=True)
     created_at = db.Column(db.Date)
     updated_at = db.Column(db.Date)
 
-    appointments = db.relationship('ServiceAppointment', backref='vehicle', cascade='all, delete-orphan')
-    sales_stats = db.relationship('SalesStats', backref='vehicle', cascade='all, delete-orphan')
+    owner = db.relationship('Customer', back_populates='vehicles')
+    appointments = db.relationship('ServiceAppointment', back_populates='vehicle', cascade='all, delete-orphan')
+    sales_stats = db.relationship('SalesStats', back_populates='vehicle', cascade='all, delete-orphan')
 
 
 class ServiceAppointment(db.Model):
     """Represents a service appointment."""
     appt_id = db.Column(db.Integer, primary_key=True)
-    appt_date = db.Column(db.Date)
+    appt_date = db.Column(db.Date, index=True)
     arrival_time = db.Column(db.Time)
     completion_time = db.Column(db.Time)
-    service_customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'))
-    vehicle_serviced_id = db.Column(db.Integer, db.ForeignKey('vehicle.vehicle_id'))
+    service_customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), index=True)
+    vehicle_serviced_id = db.Column(db.Integer, db.ForeignKey('vehicle.vehicle_id'), index=True)
     total_cost = db.Column(db.Numeric(10, 2))
     created_at = db.Column(db.Date)
     updated_at = db.Column(db.Date)
 
+    customer = db.relationship('Customer', back_populates='appointments')
+    vehicle = db.relationship('Vehicle', back_populates='appointments')
+
 
 class ServicePackage(db.Model):
     """Represents a service package."""
@@ -59,12 +73,100 @@ class ServicePackage(db.Model):
     updated_at = db.Column(db.Date)
 
 
+@db.event.listens_for(Session, 'after_flush')
+def _note_service_package_writes(session, flush_context):
+    """Remember that this transaction wrote a package row."""
+    if any(isinstance(obj, ServicePackage) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['service_packages_changed'] = True
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _service_packages_committed(session):
+    """Drop cached package lists once package writes commit, not at flush.
+
+    Invalidating at flush let a reader between flush and commit cache the
+    old list under the new generation until the TTL expired.
+    """
+    if session.info.pop('service_packages_changed', False):
+        invalidate_service()
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _service_packages_rolled_back(session):
+    session.info.pop('service_packages_changed', None)
+
+
 class SalesStats(db.Model):
     """Represents sales statistics."""
     stats_id = db.Column(db.Integer, primary_key=True)
-    vehicle_stat_id = db.Column(db.Integer, db.ForeignKey('vehicle.vehicle_id'))
+    vehicle_stat_id = db.Column(db.Integer, db.ForeignKey('vehicle.vehicle_id'), index=True)
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     cars_sold = db.Column(db.Integer)
     total_profit = db.Column(db.Numeric(10, 2))
     created_at = db.Column(db.Date)
+
+    vehicle = db.relationship('Vehicle', back_populates='sales_stats')
+
+
+class SalesDailyRollup(db.Model):
+    """Per-day sales totals by make and model, maintained incrementally on each sale."""
+    __table_args__ = (db.UniqueConstraint('sale_date', 'make', 'model'),)
+
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    sale_date = db.Column(db.Date, nullable=False)
+    make = db.Column(db.String(40))
+    model = db.Column(db.String(40))
+    cars_sold = db.Column(db.Integer, nullable=False, default=0)
+    total_profit = db.Column(db.Numeric(12, 2))
+
+
+class SaleRequest(db.Model):
+    """Outcome of a car sale submitted with an idempotency key, so retries can replay it."""
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.vehicle_id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'), nullable=False)
+    created_at = db.Column(db.DateTime, index=True)
+
+
+class BulkSaleRequest(db.Model):
+    """Results of a bulk sale submitted with an idempotency key, so retries can replay them."""
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    results = db.Column(db.Text, nullable=False)  # JSON list, as returned to the client
+    created_at = db.Column(db.DateTime, index=True)
+
+
+class OutboxEvent(db.Model):
+    """A change recorded in the same transaction as the write that caused it.
+
+    The outbox worker applies pending events to derived data (customer
+    totals, sales stats, the daily rollup) and sets processed_at.
+    """
+    __table_args__ = (db.Index('ix_outbox_event_pending', 'processed_at', 'event_id'),)
+
+    event_id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(40), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    processed_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(200))
+
+
+class CacheGeneration(db.Model):
+    """Per-namespace counter the outbox worker bumps when it changes cached data.
+
+    Web workers in other processes poll it and drop a namespace from their
+    result cache when its generation moves.
+    """
+    namespace = db.Column(db.String(40), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaVersion(db.Model):
+    """Fingerprint of the model schema last applied to this database, checked at boot."""
+    schema_version_id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
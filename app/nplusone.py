@@ -0,0 +1,93 @@
+import logging
+import re
+import threading
+from collections import Counter, deque
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_VALUE_LISTS = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+
+
+class NPlusOneError(Exception):
+    """Raised after a request repeats a statement shape, when N_PLUS_ONE_RAISE is set."""
+
+
+def statement_shape(statement):
+    """Reduce SQL to its shape: literals become ?, parameter lists collapse to (?)."""
+    shape = _LITERALS.sub('?', statement)
+    shape = _VALUE_LISTS.sub('(?)', shape)
+    return ' '.join(shape.split())
+
+
+class NPlusOneDetector:
+    """Flags requests that issue the same statement shape threshold or more times.
+
+    A lazy relationship touched in a loop, or a query inside a loop, shows up
+    as one statement repeated with different parameters; eager loading or a
+    set-based query turns it into one or two statements.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.violations = deque(maxlen=100)
+
+    def check(self, method, path, shapes, threshold):
+        """Record and log every shape counted at least threshold times; returns them."""
+        found = [
+            {"method": method, "path": path, "statement": shape, "count": count}
+            for shape, count in shapes.most_common()
+            if count >= threshold
+        ]
+        for violation in found:
+            logging.warning(
+                f"Possible N+1 query in {method} {path}: "
+                f"{violation['count']} x {violation['statement']}"
+            )
+        with self._lock:
+            self.violations.extend(found)
+        return found
+
+    def reset(self):
+        with self._lock:
+            self.violations.clear()
+
+
+detector = NPlusOneDetector()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'statement_shapes' in g:
+        g.statement_shapes[statement_shape(statement)] += 1
+
+
+def enabled(app):
+    """N_PLUS_ONE_DETECT if set, otherwise on in debug and testing mode."""
+    setting = app.config.get('N_PLUS_ONE_DETECT')
+    return (app.debug or app.testing) if setting is None else setting
+
+
+def init_app(app):
+    """Count statement shapes per request and check them after each response."""
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+    @app.before_request
+    def start_statement_shapes():
+        # Checked per request because app.run(debug=True) sets debug after create_app
+        if enabled(current_app):
+            g.statement_shapes = Counter()
+
+    @app.after_request
+    def check_statement_shapes(response):
+        shapes = g.pop('statement_shapes', None)
+        if shapes:
+            found = detector.check(request.method, request.path, shapes,
+                                   current_app.config.get('N_PLUS_ONE_THRESHOLD', 5))
+            if found and current_app.config.get('N_PLUS_ONE_RAISE'):
+                raise NPlusOneError(
+                    f"{request.method} {request.path} repeated {found[0]['count']} x {found[0]['statement']}"
+                )
+        return response
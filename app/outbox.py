@@ -0,0 +1,389 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select, true, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app.models import db, CacheGeneration, OutboxEvent
+from app.cache import result_cache, SALES_STATISTICS, SERVICE
+
+SALE_RECORDED = 'sale_recorded'
+APPOINTMENT_BOOKED = 'appointment_booked'
+
+# event_type -> function(payloads) applying a batch inside the worker's transaction
+HANDLERS = {}
+# Cache namespaces to drop once a batch of each event type has committed
+CACHE_NAMESPACES = {SALE_RECORDED: SALES_STATISTICS, APPOINTMENT_BOOKED: SERVICE}
+PURGE_INTERVAL_SECONDS = 3600
+
+
+def handles(event_type):
+    """Register the decorated function as the batch handler for an event type."""
+    def register(function):
+        HANDLERS[event_type] = function
+        return function
+    return register
+
+
+def publish(event_type, payload):
+    """Add an event to the current transaction; it commits (or not) with the caller's writes."""
+    db.session.add(OutboxEvent(event_type=event_type, payload=json.dumps(payload, default=str),
+                               created_at=datetime.now()))
+
+
+def publish_many(event_type, payloads):
+    """Add many events of one type with a single batched insert."""
+    if payloads:
+        now = datetime.now()
+        db.session.execute(insert(OutboxEvent), [
+            {'event_type': event_type, 'payload': json.dumps(payload, default=str), 'created_at': now}
+            for payload in payloads
+        ])
+
+
+class StaleBatch(Exception):
+    """Another worker marked some of the claimed events processed first."""
+
+
+class OutboxWorker:
+    """Applies outbox events to derived data in batches.
+
+    Each batch is marked processed in the same transaction that applies it,
+    so a crash before commit leaves the events pending to be applied again
+    (at-least-once) and an event is never applied twice. Marking is
+    conditional on processed_at still being NULL, so two workers racing for
+    one batch cannot both apply it. A batch that fails is retried one event
+    at a time; an event failing max_attempts times is parked until
+    replay-outbox re-queues it. The same transaction bumps the cache
+    generation of each namespace the batch changed, which is how web
+    workers in other processes learn to drop their cached results.
+    Processed events are deleted once they are older than retention.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.configure()
+
+    def configure(self, batch_size=500, poll_interval=1.0, max_attempts=5, retention_days=7):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retention = timedelta(days=retention_days)
+        self.processed = 0
+        self.failed = 0
+
+    def pending_query(self):
+        return db.select(OutboxEvent).where(
+            OutboxEvent.processed_at.is_(None), OutboxEvent.attempts < self.max_attempts
+        )
+
+    def _apply(self, events):
+        ids = [event.event_id for event in events]
+        claimed = db.session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.event_id.in_(ids), OutboxEvent.processed_at.is_(None))
+            .values(processed_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != len(ids):
+            raise StaleBatch()
+        batches = defaultdict(list)
+        for event in events:
+            batches[event.event_type].append(json.loads(event.payload))
+        for event_type, payloads in batches.items():
+            handler = HANDLERS.get(event_type)
+            if handler is not None:
+                handler(payloads)
+        bump_generations({CACHE_NAMESPACES[event_type] for event_type in batches
+                          if event_type in CACHE_NAMESPACES})
+        return batches.keys()
+
+    def _process(self, query):
+        """Claim, apply and commit the events query selects; returns (applied, error)."""
+        events = db.session.execute(query.with_for_update(skip_locked=True)).scalars().all()
+        if not events:
+            db.session.rollback()
+            return 0, None
+        try:
+            event_types = self._apply(events)
+            db.session.commit()
+        except StaleBatch:
+            db.session.rollback()
+            return 0, None
+        except Exception as e:
+            db.session.rollback()
+            return 0, e
+        for event_type in event_types:
+            if event_type in CACHE_NAMESPACES:
+                result_cache.invalidate(CACHE_NAMESPACES[event_type])
+        with self._lock:
+            self.processed += len(events)
+        return len(events), None
+
+    def _record_failure(self, event_id, error):
+        db.session.execute(
+            update(OutboxEvent).where(OutboxEvent.event_id == event_id)
+            .values(attempts=OutboxEvent.attempts + 1, last_error=str(error)[:200])
+        )
+        db.session.commit()
+        attempts = db.session.get(OutboxEvent, event_id).attempts
+        with self._lock:
+            self.failed += 1
+        if attempts >= self.max_attempts:
+            logging.error(f"Outbox event {event_id} parked after {attempts} attempts: {error}")
+        else:
+            logging.warning(f"Outbox event {event_id} failed (attempt {attempts}): {error}")
+
+    def process_batch(self):
+        """Apply up to batch_size pending events in event order; returns how many were applied."""
+        query = self.pending_query().order_by(OutboxEvent.event_id).limit(self.batch_size)
+        applied, error = self._process(query)
+        if error is None:
+            return applied
+
+        # Isolate the failing event so the rest of the batch still goes through
+        logging.warning(f"Outbox batch failed, retrying events one at a time: {error}")
+        ids = db.session.execute(
+            self.pending_query().with_only_columns(OutboxEvent.event_id)
+            .order_by(OutboxEvent.event_id).limit(self.batch_size)
+        ).scalars().all()
+        db.session.rollback()
+        for event_id in ids:
+            count, error = self._process(self.pending_query().where(OutboxEvent.event_id == event_id))
+            applied += count
+            if error is not None:
+                self._record_failure(event_id, error)
+        return applied
+
+    def drain(self):
+        """Process batches until nothing is pending; returns the number of events applied."""
+        total = 0
+        while True:
+            applied = self.process_batch()
+            if not applied:
+                return total
+            total += applied
+
+    def purge(self, retention=None):
+        """Delete events processed longer than retention ago; returns how many were deleted."""
+        cutoff = datetime.now() - (self.retention if retention is None else retention)
+        deleted = 0
+        while True:
+            # Select then delete by ID: MySQL rejects LIMIT in an IN subquery
+            ids = db.session.execute(
+                select(OutboxEvent.event_id).where(OutboxEvent.processed_at < cutoff)
+                .order_by(OutboxEvent.event_id).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                db.session.rollback()
+                return deleted
+            db.session.execute(delete(OutboxEvent).where(OutboxEvent.event_id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+
+    def run(self, app, stop=None):
+        """Poll for events until stop is set, sleeping poll_interval when the outbox is empty."""
+        stop = stop or threading.Event()
+        logging.info(f"Outbox worker started: batch size {self.batch_size}, poll every {self.poll_interval}s")
+        next_purge = time.monotonic()
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    applied = self.process_batch()
+                    if time.monotonic() >= next_purge:
+                        next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+                        purged = self.purge()
+                        if purged:
+                            logging.info(f"Purged {purged} processed outbox events")
+            except Exception as e:
+                logging.error(f"Outbox worker error: {e}")
+                applied = 0
+            if applied < self.batch_size:
+                stop.wait(self.poll_interval)
+
+    def start_thread(self, app):
+        """Run the worker on a daemon thread in this process, once."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, args=(app, self._stop),
+                                            name='outbox-worker', daemon=True)
+            self._thread.start()
+
+    def stop_thread(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def lag(self):
+        """Pending and parked event counts and the age in seconds of the oldest pending event."""
+        pending, oldest = db.session.execute(
+            db.select(db.func.count(OutboxEvent.event_id), db.func.min(OutboxEvent.created_at))
+            .where(OutboxEvent.processed_at.is_(None), OutboxEvent.attempts < self.max_attempts)
+        ).one()
+        parked = db.session.execute(
+            db.select(db.func.count(OutboxEvent.event_id))
+            .where(OutboxEvent.processed_at.is_(None), OutboxEvent.attempts >= self.max_attempts)
+        ).scalar()
+        return {
+            'pending': pending,
+            'parked': parked,
+            'lag_seconds': (datetime.now() - oldest).total_seconds() if oldest else 0.0,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {'processed': self.processed, 'failed': self.failed}
+
+
+outbox_worker = OutboxWorker()
+
+
+def bump_generations(namespaces):
+    """Advance the cache generation of each namespace inside the current transaction."""
+    for namespace in sorted(namespaces):
+        bumped = db.session.execute(
+            update(CacheGeneration).where(CacheGeneration.namespace == namespace)
+            .values(generation=CacheGeneration.generation + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if not bumped.rowcount:
+            db.session.execute(insert(CacheGeneration).values(namespace=namespace, generation=1))
+
+
+class GenerationWatcher:
+    """Drops result cache namespaces whose generation another process has bumped.
+
+    Checked at most once per interval from before_request, so a web worker
+    serves cached results at most that many seconds (plus the worker's
+    commit) after the outbox worker changed them, rather than for the
+    whole TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure()
+
+    def configure(self, interval=2.0):
+        self.interval = interval
+        self.generations = None
+        self.checked_at = 0.0
+
+    def check(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self.checked_at < self.interval:
+                return
+            self.checked_at = now
+        # Core query on the primary's engine: a replica may not have the bump yet
+        table = CacheGeneration.__table__
+        try:
+            with db.engine.connect() as connection:
+                current = dict(connection.execute(select(table.c.namespace, table.c.generation)).all())
+        except (OperationalError, ProgrammingError):
+            # No cache_generation table yet; ensure-schema creates it
+            return
+        with self._lock:
+            previous, self.generations = self.generations, current
+        if previous is None:
+            return
+        for namespace, generation in current.items():
+            if previous.get(namespace) != generation:
+                result_cache.invalidate(namespace)
+
+
+generation_watcher = GenerationWatcher()
+
+
+def replay(from_id=None, to_id=None, reprocess=False):
+    """Re-queue events for the worker and return how many were re-queued.
+
+    By default only unprocessed events are touched: their attempt counts
+    are reset, so parked events (those that exhausted max_attempts) are
+    picked up again. With reprocess, already processed events in the ID range are
+    queued again too and their effects are applied a second time, which is
+    for rebuilding derived data after it was reset or restored from a
+    backup taken before those events. Only events still within the
+    purge retention can be reprocessed.
+    """
+    condition = true() if reprocess else OutboxEvent.processed_at.is_(None)
+    query = update(OutboxEvent).where(condition)
+    if from_id is not None:
+        query = query.where(OutboxEvent.event_id >= from_id)
+    if to_id is not None:
+        query = query.where(OutboxEvent.event_id <= to_id)
+    result = db.session.execute(
+        query.values(processed_at=None, attempts=0, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    """Configure the worker and, with OUTBOX_WORKER_THREAD, run it inside this process."""
+    outbox_worker.configure(
+        batch_size=app.config.get('OUTBOX_BATCH_SIZE', 500),
+        poll_interval=app.config.get('OUTBOX_POLL_SECONDS', 1.0),
+        max_attempts=app.config.get('OUTBOX_MAX_ATTEMPTS', 5),
+        retention_days=app.config.get('OUTBOX_RETENTION_DAYS', 7),
+    )
+    generation_watcher.configure(interval=app.config.get('CACHE_GENERATION_CHECK_SECONDS', 2.0))
+    if app.config.get('CACHE_GENERATION_CHECK_SECONDS', 2.0):
+        # The outbox worker may run in another process; pick up its cache invalidations
+        @app.before_request
+        def check_cache_generations():
+            generation_watcher.check()
+
+    if app.config.get('OUTBOX_WORKER_THREAD'):
+        # Started on the first request rather than here so CLI commands don't spawn it
+        @app.before_request
+        def start_outbox_worker():
+            outbox_worker.start_thread(app)
+
+
+@click.command('outbox-worker')
+@click.option('--once', is_flag=True, help="Drain the outbox and exit instead of polling.")
+@with_appcontext
+def outbox_worker_command(once):
+    """Apply outbox events to customer totals, sales stats and the rollup."""
+    from flask import current_app
+    if once:
+        start = time.perf_counter()
+        applied = outbox_worker.drain()
+        click.echo(f"Applied {applied} outbox events in {time.perf_counter() - start:.2f}s.")
+        return
+    try:
+        outbox_worker.run(current_app._get_current_object())
+    except KeyboardInterrupt:
+        click.echo(f"Stopped after applying {outbox_worker.stats()['processed']} events.")
+
+
+@click.command('replay-outbox')
+@click.option('--from-id', type=int, help="First event ID to re-queue.")
+@click.option('--to-id', type=int, help="Last event ID to re-queue.")
+@click.option('--reprocess', is_flag=True,
+              help="Also re-queue processed events; their effects are applied again.")
+@with_appcontext
+def replay_outbox_command(from_id, to_id, reprocess):
+    """Re-queue parked (or, with --reprocess, processed) outbox events."""
+    count = replay(from_id, to_id, reprocess)
+    click.echo(f"Re-queued {count} outbox events.")
+
+
+@click.command('purge-outbox')
+@click.option('--days', type=int, help="Keep events processed within this many days (default OUTBOX_RETENTION_DAYS).")
+@with_appcontext
+def purge_outbox_command(days):
+    """Delete processed outbox events older than the retention period."""
+    count = outbox_worker.purge(None if days is None else timedelta(days=days))
+    click.echo(f"Purged {count} processed outbox events.")
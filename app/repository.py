@@ -0,0 +1,59 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import db, Customer, Vehicle, ServiceAppointment
+
+# Relationships on the models stay lazy, so touching one on an object loaded
+# elsewhere costs a query per object. Each loader here is written for one use
+# case and loads what that caller reads up front: many-to-one relationships
+# with joinedload (a JOIN in the same statement), collections with
+# selectinload (one extra IN query per collection for the whole batch).
+
+
+def vehicle_for_bill(vehicle_id):
+    """A vehicle with its owner, for the sale bill (one query)."""
+    return db.session.execute(
+        db.select(Vehicle).options(joinedload(Vehicle.owner)).where(Vehicle.vehicle_id == vehicle_id)
+    ).scalar_one_or_none()
+
+
+def appointment_for_bill(appointment_id):
+    """An appointment with its customer and vehicle, for the service bill (one query)."""
+    return db.session.execute(
+        db.select(ServiceAppointment)
+        .options(joinedload(ServiceAppointment.customer), joinedload(ServiceAppointment.vehicle))
+        .where(ServiceAppointment.appt_id == appointment_id)
+    ).scalar_one_or_none()
+
+
+def sale_bill_rows(vehicle_ids=None, start_date=None, end_date=None, batch_size=None):
+    """(vehicle, owner) rows for batch bill rendering, by ID list and/or sale date range.
+
+    With batch_size the rows are streamed in batches instead of buffered.
+    """
+    query = db.select(Vehicle, Customer).join(Customer, Vehicle.owner_id == Customer.customer_id)
+    if vehicle_ids is not None:
+        query = query.where(Vehicle.vehicle_id.in_(vehicle_ids))
+    if start_date is not None and end_date is not None:
+        query = query.where(Vehicle.sold_at.between(start_date, end_date))
+    query = query.order_by(Vehicle.sold_at, Vehicle.vehicle_id)
+    if batch_size:
+        query = query.execution_options(yield_per=batch_size)
+    return db.session.execute(query)
+
+
+def count_sale_bills(start_date, end_date):
+    """Number of vehicles sold between two dates, i.e. the bills an export would hold."""
+    return db.session.execute(
+        db.select(db.func.count(Vehicle.vehicle_id)).where(Vehicle.sold_at.between(start_date, end_date))
+    ).scalar()
+
+
+def with_collections(model, ids, relationships):
+    """Load rows of model by primary key with the named collections selectin-loaded.
+
+    Returns {primary key: object}; len(relationships) + 1 queries in total.
+    """
+    pk = model.__mapper__.primary_key[0]
+    options = [selectinload(getattr(model, name)) for name in relationships]
+    objects = db.session.execute(db.select(model).options(*options).where(pk.in_(ids))).scalars()
+    return {getattr(obj, pk.key): obj for obj in objects}
@@ -0,0 +1,90 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, select
+
+from app.models import db, Vehicle, SalesDailyRollup
+
+
+def sale_delta(deltas, sold_at, make, model, profit, sign=1):
+    """Accumulate one sale (or, with sign=-1, its reversal) into a delta map."""
+    entry = deltas[(sold_at, make, model)]
+    entry[0] += sign
+    if profit is not None:
+        entry[1] = (entry[1] or Decimal(0)) + sign * Decimal(profit)
+
+
+def new_deltas():
+    """Return an empty delta map keyed by (sale_date, make, model)."""
+    return defaultdict(lambda: [0, None])
+
+
+def apply_deltas(deltas):
+    """Apply accumulated sale deltas to the rollup table without committing.
+
+    Existing rows for the affected days are loaded and locked in one query;
+    make/model are matched in Python so NULL values group the same way as
+    GROUP BY.
+    """
+    if not deltas:
+        return
+    dates = {key[0] for key in deltas}
+    rows = {
+        (row.sale_date, row.make, row.model): row
+        for row in SalesDailyRollup.query.filter(SalesDailyRollup.sale_date.in_(dates)).with_for_update()
+    }
+    for key, (count, profit) in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            row = SalesDailyRollup(sale_date=key[0], make=key[1], model=key[2], cars_sold=0)
+            db.session.add(row)
+            rows[key] = row
+        row.cars_sold += count
+        if profit is not None:
+            row.total_profit = (row.total_profit or Decimal(0)) + profit
+        if row.cars_sold <= 0:
+            if row in db.session.new:
+                # A reversal for a day with no rollup row: nothing to store or delete
+                db.session.expunge(row)
+            else:
+                db.session.delete(row)
+
+
+def rebuild_rollup():
+    """Recompute the whole rollup table from the vehicle table and commit."""
+    db.session.execute(delete(SalesDailyRollup))
+    grouped = select(
+        Vehicle.sold_at, Vehicle.make, Vehicle.model,
+        db.func.count(Vehicle.vehicle_id), db.func.sum(Vehicle.profit),
+    ).where(Vehicle.sold_at.isnot(None)).group_by(Vehicle.sold_at, Vehicle.make, Vehicle.model)
+    db.session.execute(
+        insert(SalesDailyRollup).from_select(
+            ['sale_date', 'make', 'model', 'cars_sold', 'total_profit'], grouped
+        )
+    )
+    db.session.commit()
+    return SalesDailyRollup.query.count()
+
+
+def sales_by_model(start_date, end_date):
+    """Return cars sold and profit per make/model for an inclusive date range."""
+    rows = db.session.query(
+        SalesDailyRollup.make, SalesDailyRollup.model,
+        db.func.sum(SalesDailyRollup.cars_sold), db.func.sum(SalesDailyRollup.total_profit),
+    ).filter(
+        SalesDailyRollup.sale_date.between(start_date, end_date)
+    ).group_by(SalesDailyRollup.make, SalesDailyRollup.model).all()
+    return [
+        {"make": row[0], "model": row[1], "cars_sold": int(row[2]), "total_profit": row[3]}
+        for row in rows
+    ]
+
+
+@click.command('rebuild-sales-rollup')
+@with_appcontext
+def rebuild_sales_rollup_command():
+    """Backfill the daily sales rollup from the vehicle table."""
+    count = rebuild_rollup()
+    click.echo(f"Rebuilt sales rollup: {count} day/model rows.")
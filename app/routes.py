@@ -1,17 +1,23 @@
 import logging
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, send_file
-from app.models import db, Customer, Vehicle, ServiceAppointment, SalesStats, ServicePackage
-from datetime import datetime
-from reportlab.pdfgen import canvas
-import os
-import tempfile
-
-# Initialize the logger
-logging.basicConfig(
-    filename='app_logs.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+import uuid
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, redirect, url_for, flash, send_file, stream_with_context
+from app.models import db, Customer, Vehicle, ServiceAppointment, ServicePackage
+from app.sales import parse_sale_rows, record_bulk_sales, sell_vehicle, SaleError
+from app.repository import vehicle_for_bill, appointment_for_bill, sale_bill_rows, count_sale_bills
+from app.rollup import sales_by_model
+from app.billing import (
+    bill_renderer, sale_bill_data, service_bill_data, iter_sale_bills_pdf, iter_sale_bills_zip,
+    SALE_BILL, SERVICE_BILL,
 )
+from app.scheduler import service_scheduler
+from app.search import inventory_index, FACETS
+from app.analytics import sales_analytics
+from app.metrics import metrics
+from app.export import stream_export, DATASETS, FORMATS
+from app.cache import result_cache, invalidate_service, SALES_STATISTICS, SERVICE
+from app.outbox import publish, APPOINTMENT_BOOKED
+from app.routing import read_only, replica_reads
+from datetime import datetime, timedelta
 
 bp = Blueprint('routes', __name__)
 
@@ -21,160 +27,108 @@ def home():
     logging.info("Accessed homepage.")
     return render_template('home.html')
 
-from decimal import Decimal
-
-from decimal import Decimal
-from sqlalchemy.sql import func
-
 @bp.route('/sell_car', methods=['GET', 'POST'])
 def sell_car():
     """Handle car sale and render the form."""
     if request.method == 'GET':
         logging.info("Accessed Sell Car page.")
-        return render_template('sell_car.html')
+        # A fresh key per rendered form, so resubmitting the same form replays the sale
+        return render_template('sell_car.html', idempotency_key=uuid.uuid4().hex)
 
-    if request.method == 'POST':
-        try:
-            # Extract form data
-            data = request.form
-            vehicle_id = data.get('vehicle_id')
-            first_name = data.get('first_name')
-            last_name = data.get('last_name')
-            sale_price = float(data.get('sale_price'))
-            sold_at = data.get('sold_at')
-
-            # Validate input
-            if not all([vehicle_id, first_name, last_name, sale_price, sold_at]):
-                logging.error("Missing form fields for car sale.")
-                flash("All fields are required.", "danger")
-                return redirect('/sell_car')
+    data = request.form
+    vehicle_id = data.get('vehicle_id')
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key') or None
+    try:
+        result = sell_vehicle(data, idempotency_key)
+    except (SaleError, ValueError) as e:
+        logging.warning(f"Car sale rejected for Vehicle ID {vehicle_id}: {e}")
+        flash(str(e), "danger")
+        return redirect('/sell_car')
+    except Exception as e:
+        logging.error(f"Error in car sale: {e}")
+        flash("An error occurred during the car sale process.", "danger")
+        return redirect('/sell_car')
 
-            # Check if the vehicle exists
-            vehicle = Vehicle.query.get(vehicle_id)
-            if not vehicle:
-                logging.warning(f"Vehicle not found: {vehicle_id}")
-                flash("Vehicle not found.", "danger")
-                return redirect('/sell_car')
-
-            # Check if the customer exists
-            customer = Customer.query.filter_by(first_name=first_name, last_name=last_name).first()
-            if not customer:
-                # If customer doesn't exist, create a new customer
-                max_id = db.session.query(func.max(Customer.customer_id)).scalar() or 0
-                customer_id = max_id + 1
-                customer = Customer(
-                    customer_id=customer_id,
-                    first_name=first_name,
-                    last_name=last_name,
-                    total_spent=Decimal(0),
-                    total_profit=Decimal(0),
-                    created_at=datetime.now().date(),
-                    updated_at=datetime.now().date(),
-                )
-                db.session.add(customer)
-                db.session.commit()
-                logging.info(f"New customer added: {first_name} {last_name} (ID: {customer_id})")
-            else:
-                customer_id = customer.customer_id
-
-            # Update vehicle details
-            vehicle.sold_at = datetime.strptime(sold_at, '%Y-%m-%d').date()
-            vehicle.sale_price = sale_price
-            vehicle.profit = Decimal(sale_price) - Decimal(vehicle.purchase_price)
-            vehicle.owner_id = customer_id
-
-            # Update customer details
-            # Update customer details
-            customer.total_spent = (customer.total_spent or Decimal(0)) + Decimal(sale_price)
-            customer.total_profit = (customer.total_profit or Decimal(0)) + vehicle.profit
-
-
-            # Update/Add sales stats
-            stats = db.session.query(SalesStats).filter(
-                SalesStats.vehicle_stat_id == vehicle_id
-            ).first()
-
-            if stats:
-                # Update existing stats record
-                stats.cars_sold += 1
-                stats.total_profit += vehicle.profit
-                stats.end_date = vehicle.sold_at
-            else:
-                # Create new stats record
-                stats = SalesStats(
-                    vehicle_stat_id=vehicle_id,
-                    start_date=vehicle.sold_at,
-                    end_date=vehicle.sold_at,
-                    cars_sold=1,
-                    total_profit=vehicle.profit,
-                    created_at=datetime.now(),
-                )
-                db.session.add(stats)
+    if result['replayed']:
+        logging.info(f"Car sale replayed for idempotency key {idempotency_key}: Vehicle ID {result['vehicle_id']}.")
+        flash("This car sale was already recorded.", "info")
+    else:
+        inventory_index.update(db.session.get(Vehicle, result['vehicle_id']))
+        logging.info(
+            f"Car sold: Vehicle ID {result['vehicle_id']} to Customer ID {result['customer_id']}. Stats updated."
+        )
+        flash("Car sale recorded successfully!", "success")
+    # Redirect to bill page
+    return redirect(url_for('routes.generate_bill', vehicle_id=result['vehicle_id']))
+
+@bp.route('/sales/bulk', methods=['POST'])
+def bulk_sell_cars():
+    """Record a batch of car sales from a CSV or JSON lines payload.
+
+    With an Idempotency-Key header, a retried batch returns the original
+    results instead of being applied again.
+    """
+    upload = request.files.get('file')
+    if upload:
+        payload, content_type = upload.read(), upload.mimetype or upload.filename
+    else:
+        payload, content_type = request.get_data(), request.content_type
 
-            db.session.commit()
-            logging.info(
-                f"Car sold: Vehicle ID {vehicle_id} to Customer ID {customer_id}. Stats updated."
-            )
-            flash("Car sale recorded successfully!", "success")
-            # Redirect to bill page
-            return redirect(url_for('routes.generate_bill', vehicle_id=vehicle.vehicle_id))
-    
-        except Exception as e:
-            logging.error(f"Error in car sale: {e}")
-            flash("An error occurred during the car sale process.", "danger")
-            return redirect('/sell_car')
+    try:
+        rows = parse_sale_rows(payload, content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        logging.error(f"Invalid bulk sale payload: {e}")
+        return jsonify({"error": "Payload must be CSV or JSON lines."}), 400
+
+    try:
+        results, replayed = record_bulk_sales(rows, request.headers.get('Idempotency-Key'))
+    except ValueError as e:
+        logging.warning(f"Invalid bulk car sale request: {e}")
+        return jsonify({"error": str(e)}), 400
+    except SaleError as e:
+        logging.warning(f"Bulk car sale rejected: {e}")
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in bulk car sale: {e}")
+        return jsonify({"error": "An error occurred during the bulk sale process."}), 500
+    succeeded = sum(1 for result in results if result['status'] == 'ok')
+    if replayed:
+        logging.info(f"Bulk sale replayed for a retried idempotency key: {succeeded} of {len(results)} rows.")
+    else:
+        inventory_index.refresh([result['vehicle_id'] for result in results if result['status'] == 'ok'])
+        logging.info(f"Bulk sale processed: {succeeded} of {len(results)} rows recorded.")
+    return jsonify({
+        "processed": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "replayed": replayed,
+        "results": results,
+    })
 
 @bp.route('/bill/<int:vehicle_id>', methods=['GET'])
+@read_only
 def generate_bill(vehicle_id):
     """Generate and display or download the bill."""
     try:
-        # Fetch the vehicle details
-        vehicle = Vehicle.query.get(vehicle_id)
+        # Fetch the vehicle and its owner in one query
+        vehicle = vehicle_for_bill(vehicle_id)
         if not vehicle:
             logging.warning(f"Vehicle not found: {vehicle_id}")
             flash("Vehicle not found.", "danger")
             return redirect('/sell_car')
 
-        # Fetch the customer details
-        customer = Customer.query.get(vehicle.owner_id)
+        customer = vehicle.owner
         if not customer:
             logging.warning(f"Customer not found for Vehicle ID: {vehicle_id}")
             flash("Customer not found.", "danger")
             return redirect('/sell_car')
 
-        # Prepare data for the bill
-        bill_data = {
-            "customer_name": f"{customer.first_name} {customer.last_name}",
-            "customer_phone": customer.phone or "N/A",
-            "customer_email": customer.email or "N/A",
-            "vehicle_make": vehicle.make,
-            "vehicle_model": vehicle.model,
-            "vehicle_year": vehicle.year,
-            "vehicle_vin": vehicle.vin,
-            "sale_price": f"${vehicle.sale_price:.2f}" if vehicle.sale_price else "N/A",
-            "sale_date": vehicle.sold_at.strftime('%Y-%m-%d') if vehicle.sold_at else "N/A",
-            "profit": f"${vehicle.profit:.2f}" if vehicle.profit else "N/A",
-        }
-
-        # Generate the PDF using ReportLab
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            pdf_file = tmp_file.name
-            c = canvas.Canvas(pdf_file)
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(100, 800, "Car Dealership Bill")
-            c.setFont("Helvetica", 12)
-            c.drawString(100, 770, f"Customer Name: {bill_data['customer_name']}")
-            c.drawString(100, 750, f"Phone: {bill_data['customer_phone']}")
-            c.drawString(100, 730, f"Email: {bill_data['customer_email']}")
-            c.drawString(100, 710, f"Vehicle: {bill_data['vehicle_make']} {bill_data['vehicle_model']} ({bill_data['vehicle_year']})")
-            c.drawString(100, 690, f"VIN: {bill_data['vehicle_vin']}")
-            c.drawString(100, 670, f"Sale Price: {bill_data['sale_price']}")
-            c.drawString(100, 650, f"Sale Date: {bill_data['sale_date']}")
-            c.drawString(100, 630, f"Profit: {bill_data['profit']}")
-            c.drawString(100, 600, "Thank you for your business!")
-            c.save()
-
-        # Serve the PDF as a downloadable file
+        # Render (or reuse) the PDF in the bill worker pool
+        with metrics.render_timer(SALE_BILL):
+            pdf_file = bill_renderer.render(SALE_BILL, sale_bill_data(vehicle, customer))
+
+        # Serve the cached PDF; the file is kept for repeat downloads
         return send_file(
             pdf_file,
             as_attachment=True,
@@ -186,14 +140,128 @@ def generate_bill(vehicle_id):
         logging.error(f"Error generating bill: {e}")
         flash("An error occurred while generating the bill.", "danger")
         return redirect('/sell_car')
-    finally:
-        # Cleanup: Remove the generated PDF file after it is served
-        if 'pdf_file' in locals() and os.path.exists(pdf_file):
-            os.remove(pdf_file)
+
+@bp.route('/bills/export', methods=['GET'])
+@read_only
+def export_bills():
+    """Stream every sale bill for a date range as one PDF or a ZIP of PDFs."""
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify({"error": "start_date and end_date are required (YYYY-MM-DD)."}), 400
+    export_format = request.args.get('format', 'pdf')
+    if export_format not in ('pdf', 'zip'):
+        return jsonify({"error": "format must be pdf or zip."}), 400
+    if export_format == 'pdf':
+        # A single PDF is built in memory before the first byte is sent; ZIP streams
+        max_bills = current_app.config.get('BILL_PDF_MAX_BILLS', 500)
+        count = count_sale_bills(start_date, end_date)
+        if count > max_bills:
+            return jsonify({"error": f"{count} bills exceed the {max_bills}-bill limit for one PDF; "
+                                     f"use format=zip or a shorter date range."}), 400
+
+    # One joined query, fetched in batches while the response streams
+    rows = sale_bill_rows(start_date=start_date, end_date=end_date, batch_size=500)
+    logging.info(f"Exporting {export_format} bills for period: {start_date} to {end_date}")
+
+    if export_format == 'zip':
+        body, mimetype = iter_sale_bills_zip(rows), 'application/zip'
+    else:
+        body, mimetype = iter_sale_bills_pdf(rows), 'application/pdf'
+    filename = f"bills_{start_date}_{end_date}.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@bp.route('/export/<dataset>', methods=['GET'])
+@read_only
+def export_dataset(dataset):
+    """Stream a full table export as CSV or NDJSON, optionally gzipped."""
+    export_format = request.args.get('format', 'csv')
+    if dataset not in DATASETS or export_format not in FORMATS:
+        return jsonify({"error": f"dataset must be one of {', '.join(DATASETS)}; "
+                                 f"format must be one of {', '.join(FORMATS)}."}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    logging.info(f"Exporting {dataset} as {export_format}{' (gzip)' if compress else ''}")
+    filename = f"{dataset}.{export_format}" + (".gz" if compress else "")
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(stream_export(dataset, export_format, compress)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+@bp.route('/bill_jobs', methods=['POST'])
+@read_only
+def start_bill_job():
+    """Queue sale bills for a batch of vehicles and return a job id to poll."""
+    payload = request.get_json(silent=True)
+    vehicle_ids = payload.get('vehicle_ids') if isinstance(payload, dict) else None
+    if not vehicle_ids:
+        return jsonify({"error": "vehicle_ids is required."}), 400
+    if not isinstance(vehicle_ids, list) or not all(
+            isinstance(vehicle_id, int) and not isinstance(vehicle_id, bool) for vehicle_id in vehicle_ids):
+        return jsonify({"error": "vehicle_ids must be a list of integers."}), 400
+
+    rows = sale_bill_rows(vehicle_ids=vehicle_ids).all()
+    job_id = bill_renderer.start_job(
+        (SALE_BILL, vehicle.vehicle_id, sale_bill_data(vehicle, customer)) for vehicle, customer in rows
+    )
+    logging.info(f"Bill job {job_id} queued for {len(rows)} vehicles.")
+    return jsonify({"job_id": job_id, "url": url_for('routes.bill_job_status', job_id=job_id)}), 202
+
+@bp.route('/bill_jobs/<job_id>', methods=['GET'])
+def bill_job_status(job_id):
+    """Report the progress of a batch bill job."""
+    status = bill_renderer.job_status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found."}), 404
+    for item in status["items"]:
+        item["url"] = url_for('routes.generate_bill', vehicle_id=item["name"])
+    return jsonify(status)
+
+@bp.route('/vehicles/search', methods=['GET'])
+@read_only
+def search_vehicles():
+    """Faceted inventory search, e.g. ?make=Toyota,Honda&status=unsold&year_min=2018."""
+    filters = {}
+    for facet in FACETS:
+        values = [value for arg in request.args.getlist(facet) for value in arg.split(',') if value]
+        if values:
+            filters[facet] = values
+    try:
+        # Parsed by hand: type=int would silently drop a bad value and skip the filter
+        year_min, year_max = (int(request.args[arg]) if request.args.get(arg) else None
+                              for arg in ('year_min', 'year_max'))
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "year_min, year_max, limit and offset must be integers."}), 400
+    if year_min is not None or year_max is not None:
+        # A year range becomes an OR over the year values the index knows about
+        years = [
+            year for year in inventory_index.facet_labels('year')
+            if (year_min is None or year >= year_min) and (year_max is None or year <= year_max)
+        ]
+        if 'year' in filters:
+            years = [year for year in years if str(year) in filters['year']]
+        filters['year'] = years
+
+    result = inventory_index.search(filters, limit=limit, offset=offset)
+    result.update(limit=limit, offset=offset)
+    return jsonify(result)
+
 
 
-    
 @bp.route('/sales_statistics', methods=['GET', 'POST'])
+@read_only
 def sales_statistics_page():
     """Retrieve and display sales statistics."""
     if request.method == 'POST':
@@ -202,16 +270,22 @@ def sales_statistics_page():
             start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
             end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
 
-            stats = db.session.query(
-                Vehicle.make, Vehicle.model, db.func.count(Vehicle.vehicle_id), db.func.sum(Vehicle.profit)
-            ).filter(Vehicle.sold_at.between(start_date, end_date)).group_by(Vehicle.make, Vehicle.model).all()
-
-            results = [
-                {"make": row[0], "model": row[1], "cars_sold": row[2], "total_profit": row[3]}
-                for row in stats
-            ]
+            # Sum the daily rollup instead of scanning every sold vehicle
+            results = result_cache.get_or_set(
+                (SALES_STATISTICS, start_date, end_date),
+                lambda: sales_by_model(start_date, end_date),
+            )
+            # Trend reports run on the analytics snapshot, not the database
+            analytics = {
+                name: sales_analytics.report(name, start_date, end_date)
+                for name in ('monthly', 'margin_by_year', 'top_customers')
+            }
+            analytics['rolling'] = sales_analytics.report(
+                'rolling', max(start_date, end_date - timedelta(days=29)), end_date
+            )
             logging.info(f"Sales statistics retrieved for period: {start_date} to {end_date}")
-            return render_template('sales_statistics.html', stats=results)
+            return render_template('sales_statistics.html', stats=results, analytics=analytics,
+                                   start_date=start_date, end_date=end_date)
         except Exception as e:
             logging.error(f"Error retrieving sales statistics: {e}")
             flash("An error occurred while retrieving sales statistics.", "danger")
@@ -228,11 +302,7 @@ def handle_add_customer():
             email = request.form.get('email')
             address = request.form.get('address')
 
-            max_id = db.session.query(db.func.max(Customer.customer_id)).scalar() or 0
-            customer_id = max_id + 1
-
             customer = Customer(
-                customer_id=customer_id,
                 first_name=first_name,
                 last_name=last_name,
                 phone=phone,
@@ -245,19 +315,33 @@ def handle_add_customer():
             )
             db.session.add(customer)
             db.session.commit()
-            logging.info(f"Customer added: {first_name} {last_name} (ID: {customer_id})")
+            logging.info(f"Customer added: {first_name} {last_name} (ID: {customer.customer_id})")
             flash("Customer added successfully!", "success")
         except Exception as e:
             logging.error(f"Error adding customer: {e}")
             flash("An error occurred while adding the customer.", "danger")
     return render_template('add_customer.html')
 
+def load_service_packages():
+    """Load service packages as plain dicts so they can be shared across requests."""
+    with replica_reads():
+        packages = ServicePackage.query.all()
+    return [
+        {"pkg_id": p.pkg_id, "pkg_name": p.pkg_name, "description": p.description, "base_cost": p.base_cost}
+        for p in packages
+    ]
+
+@bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Report result cache hit/miss counters."""
+    return jsonify(result_cache.stats())
+
 @bp.route('/service', methods=['GET', 'POST'])
 def schedule_service():
     """Handle scheduling a service appointment."""
     if request.method == 'GET':
         logging.info("Accessed Service Scheduling page.")
-        service_packages = ServicePackage.query.all()
+        service_packages = result_cache.get_or_set((SERVICE, 'packages'), load_service_packages)
         return render_template('schedule_service.html', service_packages=service_packages)
 
 
@@ -290,18 +374,39 @@ def schedule_service():
                 flash("Invalid vehicle ID.", "danger")
                 return redirect('/service')
 
-            # Schedule the service
-            appointment = ServiceAppointment(
-                appt_date=datetime.strptime(appt_date, '%Y-%m-%d').date(),
-                arrival_time=datetime.strptime(arrival_time, '%H:%M').time(),
-                service_customer_id=vehicle.owner_id,
-                vehicle_serviced_id=vehicle_id,
-                total_cost=service_package.base_cost,
-                created_at=datetime.now().date(),
-                updated_at=datetime.now().date(),
-            )
-            db.session.add(appointment)
-            db.session.commit()
+            # Claim a service bay; the day's bookings stay locked until commit
+            appt_date = datetime.strptime(appt_date, '%Y-%m-%d').date()
+            arrival_time = datetime.strptime(arrival_time, '%H:%M').time()
+            duration = service_scheduler.duration_for(service_package.pkg_id)
+            with service_scheduler.booking(appt_date, arrival_time, duration) as completion_time:
+                if completion_time is None:
+                    db.session.rollback()
+                    logging.warning(f"No service bay free on {appt_date} at {arrival_time}")
+                    flash("No service bay is free at that time. Please choose another slot.", "danger")
+                    return redirect('/service')
+
+                # Schedule the service
+                appointment = ServiceAppointment(
+                    appt_date=appt_date,
+                    arrival_time=arrival_time,
+                    completion_time=completion_time,
+                    service_customer_id=vehicle.owner_id,
+                    vehicle_serviced_id=vehicle_id,
+                    total_cost=service_package.base_cost,
+                    created_at=datetime.now().date(),
+                    updated_at=datetime.now().date(),
+                )
+                db.session.add(appointment)
+                db.session.flush()
+                publish(APPOINTMENT_BOOKED, {
+                    'appt_id': appointment.appt_id,
+                    'customer_id': appointment.service_customer_id,
+                    'vehicle_id': appointment.vehicle_serviced_id,
+                    'appt_date': appointment.appt_date.isoformat(),
+                    'total_cost': str(appointment.total_cost),
+                })
+                db.session.commit()
+            invalidate_service()
 
             logging.info(f"Service appointment scheduled: {appointment.appt_id}")
             flash("Service appointment scheduled successfully!", "success")
@@ -315,15 +420,46 @@ def schedule_service():
 
         
 
-import os
-from flask import send_file
+@bp.route('/service/next_slot', methods=['GET'])
+def next_service_slot():
+    """Find the earliest free bay slot for a service package."""
+    try:
+        package_id = int(request.args['package_id'])
+        from_date = datetime.strptime(request.args.get('date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        after = request.args.get('after')
+        after_time = datetime.strptime(after, '%H:%M').time() if after else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "package_id is required; date is YYYY-MM-DD and after is HH:MM."}), 400
+
+    slot = service_scheduler.next_free_slot(package_id, from_date, after_time)
+    if slot is None:
+        return jsonify({"error": "No free slot in the search window."}), 404
+    return jsonify({
+        "package_id": package_id,
+        "appt_date": slot[0].strftime('%Y-%m-%d'),
+        "arrival_time": slot[1].strftime('%H:%M'),
+        "duration_minutes": service_scheduler.duration_for(package_id),
+    })
+
+@bp.route('/service/utilisation', methods=['GET'])
+def service_utilisation():
+    """Report the booked fraction of bay time per day for a week."""
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        days = min(int(request.args.get('days', 7)), 62)
+    except ValueError:
+        return jsonify({"error": "start_date is YYYY-MM-DD and days is an integer."}), 400
+
+    utilisation = service_scheduler.utilisation(start_date, days)
+    return jsonify({day.strftime('%Y-%m-%d'): round(value, 4) for day, value in utilisation.items()})
 
 @bp.route('/service_bill/<int:appointment_id>', methods=['GET'])
+@read_only
 def generate_service_bill(appointment_id):
     """Generate and display or download the service bill."""
     try:
-        # Fetch appointment, customer, and vehicle details
-        appointment = ServiceAppointment.query.get(appointment_id)
+        # Fetch appointment, customer, and vehicle details in one query
+        appointment = appointment_for_bill(appointment_id)
         if not appointment:
             logging.warning(f"Service appointment not found: {appointment_id}")
             flash("Service appointment not found.", "danger")
@@ -336,39 +472,9 @@ def generate_service_bill(appointment_id):
             flash("Associated customer or vehicle details are missing.", "danger")
             return redirect('/service')
 
-        # Prepare data for the bill
-        bill_data = {
-            "customer_name": f"{customer.first_name} {customer.last_name}",
-            "customer_phone": customer.phone or "N/A",
-            "customer_email": customer.email or "N/A",
-            "vehicle_details": f"{vehicle.make} {vehicle.model} ({vehicle.year})",
-            "appt_date": appointment.appt_date.strftime('%Y-%m-%d'),
-            "arrival_time": appointment.arrival_time.strftime('%H:%M'),
-            "completion_time": appointment.completion_time.strftime('%H:%M') if appointment.completion_time else "N/A",
-            "total_cost": f"${appointment.total_cost:.2f}" if appointment.total_cost else "N/A",
-        }
-
-        # Ensure the directory exists
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-
-        # Generate the PDF
-        pdf_file = os.path.join(temp_dir, f"service_bill_{appointment_id}.pdf")
-        c = canvas.Canvas(pdf_file)
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(100, 800, "Car Dealership Service Bill")
-        c.setFont("Helvetica", 12)
-        c.drawString(100, 770, f"Customer Name: {bill_data['customer_name']}")
-        c.drawString(100, 750, f"Phone: {bill_data['customer_phone']}")
-        c.drawString(100, 730, f"Email: {bill_data['customer_email']}")
-        c.drawString(100, 710, f"Vehicle: {bill_data['vehicle_details']}")
-        c.drawString(100, 690, f"Appointment Date: {bill_data['appt_date']}")
-        c.drawString(100, 670, f"Arrival Time: {bill_data['arrival_time']}")
-        c.drawString(100, 650, f"Completion Time: {bill_data['completion_time']}")
-        c.drawString(100, 630, f"Total Cost: {bill_data['total_cost']}")
-        c.drawString(100, 600, "Thank you for your business!")
-        c.save()
+        # Render (or reuse) the PDF in the bill worker pool
+        with metrics.render_timer(SERVICE_BILL):
+            pdf_file = bill_renderer.render(SERVICE_BILL, service_bill_data(appointment, customer, vehicle))
 
         # Serve the PDF
         return send_file(
@@ -382,7 +488,3 @@ def generate_service_bill(appointment_id):
         logging.error(f"Error generating service bill: {e}")
         flash("An error occurred while generating the service bill.", "danger")
         return redirect('/service')
-    finally:
-        # Cleanup: Remove the generated PDF file after it is served
-        if os.path.exists(pdf_file):
-            os.remove(pdf_file)
@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app, g, has_request_context, request, session
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+REPLICA_BIND_PREFIX = 'replica_'
+STICKY_SESSION_KEY = 'db_primary_until'
+
+
+def read_only(view):
+    """Mark a view whose queries may be served by a read replica."""
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def replica_reads():
+    """Let the queries in this block use a replica; no-op outside a request."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('replica_reads', False)
+    g.replica_reads = True
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+
+def _replica_for_request(db_session):
+    """The replica engine this request reads from, or None for the primary."""
+    if not has_request_context() or not g.get('replica_reads') or g.get('primary_pinned'):
+        return None
+    if db_session.info.get('wrote'):
+        return None
+    if 'db_replica' not in g:
+        # One replica per request, so every read sees the same snapshot
+        g.db_replica = replica_router.choose()
+    return g.db_replica
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    return getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the current request allows it.
+
+    Flushes, INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE always go to the
+    primary, and after the first of them the rest of the request stays on
+    the primary too so it reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or _is_write(clause):
+                self.info['wrote'] = True
+            else:
+                replica = _replica_for_request(self)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Tracks replica health and hands out healthy replicas round-robin.
+
+    A background thread probes each replica with SELECT 1 every
+    check_interval seconds, so a replica that stops answering costs the
+    probe its connect timeout rather than every read; choose only reads the
+    recorded health. A connection error on a replica marks it down straight
+    away. With no healthy replica (including before the first probe), reads
+    go to the primary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.configure()
+
+    def configure(self, bind_keys=(), check_interval=10):
+        with self._lock:
+            self.bind_keys = list(bind_keys)
+            self.check_interval = check_interval
+            self.healthy = {key: False for key in self.bind_keys}
+            self.checked_at = {key: None for key in self.bind_keys}
+            self.reads = {key: 0 for key in self.bind_keys}
+            self._next = 0
+
+    def _due(self):
+        """Claim the replicas whose health check is due, so only one thread probes each."""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                key for key in self.bind_keys
+                if self.checked_at[key] is None or now - self.checked_at[key] >= self.check_interval
+            ]
+            for key in due:
+                self.checked_at[key] = now
+        return due
+
+    def _seconds_until_due(self):
+        now = time.monotonic()
+        with self._lock:
+            checked = [self.checked_at[key] for key in self.bind_keys]
+        if not checked or None in checked:
+            return 0
+        return max(0.0, min(checked) + self.check_interval - now)
+
+    def check_all(self):
+        """Probe every replica now; returns the keys of the healthy ones."""
+        return [key for key in self.bind_keys if self.check(key)]
+
+    def run(self, app, stop):
+        """Probe replicas as their checks fall due until stop is set."""
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    for key in self._due():
+                        self.check(key)
+            except Exception as e:
+                logging.error(f"Replica health check error: {e}")
+            stop.wait(max(self._seconds_until_due(), 0.5))
+
+    def start_thread(self, app):
+        """Run the health checks on a daemon thread in this process, once."""
+        with self._lock:
+            if not self.bind_keys or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, args=(app, self._stop),
+                                            name='replica-health', daemon=True)
+            self._thread.start()
+
+    def stop_thread(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def check(self, key):
+        """Probe one replica and record whether it answered."""
+        from app import db
+        try:
+            with db.engines[key].connect() as connection:
+                connection.execute(text('SELECT 1'))
+            healthy = True
+        except Exception as e:
+            healthy = False
+            error = e
+        with self._lock:
+            changed = self.healthy[key] != healthy
+            self.healthy[key] = healthy
+            self.checked_at[key] = time.monotonic()
+        if changed and healthy:
+            logging.info(f"Read replica {key} is healthy.")
+        elif changed or not healthy:
+            logging.warning(f"Read replica {key} is unavailable, reads fall back to the primary: {error}")
+        return healthy
+
+    def mark_down(self, key, error):
+        with self._lock:
+            was_healthy = self.healthy.get(key)
+            self.healthy[key] = False
+            self.checked_at[key] = time.monotonic()
+        if was_healthy:
+            logging.warning(f"Read replica {key} marked down after an error: {error}")
+
+    def choose(self):
+        """Return the engine of the next healthy replica, or None; never probes."""
+        if not self.bind_keys:
+            return None
+        with self._lock:
+            candidates = [key for key in self.bind_keys if self.healthy[key]]
+            if not candidates:
+                return None
+            key = candidates[self._next % len(candidates)]
+            self._next += 1
+            self.reads[key] += 1
+        from app import db
+        return db.engines[key]
+
+    def status(self):
+        with self._lock:
+            return {
+                key: {'healthy': self.healthy[key], 'requests': self.reads[key]}
+                for key in self.bind_keys
+            }
+
+
+replica_router = ReplicaRouter()
+
+
+def add_replica_binds(app):
+    """Register SQLALCHEMY_REPLICA_URIS as replica_N binds; call before db.init_app."""
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    if uris:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update({f"{REPLICA_BIND_PREFIX}{index}": uri for index, uri in enumerate(uris)})
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app):
+    """Route read-only endpoints to the replica binds and keep writers on the primary."""
+    from app import db
+    bind_keys = [key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                 if key.startswith(REPLICA_BIND_PREFIX)]
+    replica_router.configure(bind_keys, check_interval=app.config.get('REPLICA_HEALTH_CHECK_SECONDS', 10))
+    if not bind_keys:
+        return
+
+    with app.app_context():
+        for key in bind_keys:
+            def mark_down(context, key=key):
+                if context.is_disconnect or context.connection is None:
+                    replica_router.mark_down(key, context.original_exception)
+            event.listen(db.engines[key], 'handle_error', mark_down)
+
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+    @app.before_request
+    def route_reads():
+        # Started on the first request rather than here so CLI commands don't spawn it
+        replica_router.start_thread(app)
+        # Reset per request: an app context (and its g and session) can outlive one
+        g.pop('db_replica', None)
+        db.session.info.pop('wrote', None)
+        view = current_app.view_functions.get(request.endpoint)
+        g.replica_reads = getattr(view, 'replica_reads', False)
+        # Recently wrote: stay on the primary until replicas have caught up
+        g.primary_pinned = session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+    @app.after_request
+    def remember_writes(response):
+        if db.session.info.pop('wrote', False):
+            session[STICKY_SESSION_KEY] = time.time() + sticky_seconds
+        return response
+
+
+@click.command('sync-replicas')
+@with_appcontext
+def sync_replicas_command():
+    """Copy a SQLite primary into SQLite stand-in replicas, for local testing."""
+    from app import db
+    primary = db.engines[None]
+    if primary.dialect.name != 'sqlite':
+        raise click.ClickException("Only SQLite stand-ins can be synced; real replicas use replication.")
+    for key in replica_router.bind_keys:
+        replica = db.engines[key]
+        if replica.dialect.name != 'sqlite':
+            click.echo(f"Skipping {key}: not SQLite.")
+            continue
+        source, target = primary.raw_connection(), replica.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            source.close()
+            target.close()
+        click.echo(f"Copied the primary database to {key} ({replica.url.database}).")
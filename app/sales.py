@@ -0,0 +1,455 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import db, Customer, Vehicle, SalesStats, SaleRequest, BulkSaleRequest
+from app.outbox import handles, publish, publish_many, SALE_RECORDED
+from app.rollup import apply_deltas, new_deltas, sale_delta
+
+SALE_FIELDS = ('vehicle_id', 'first_name', 'last_name', 'sale_price', 'sold_at')
+SALE_RETRIES = 3
+IDEMPOTENCY_KEY_LENGTH = 64
+# sale_price is Numeric(10, 2): anything at or above this does not fit
+MAX_SALE_PRICE = Decimal(10 ** 8)
+# MySQL deadlock and lock wait timeout; SQLite reports busy as "database is locked"
+TRANSIENT_ERROR_CODES = (1205, 1213)
+
+
+class SaleError(Exception):
+    """A car sale that was rejected; the message is meant for the user."""
+
+
+def parse_sale_rows(payload, content_type):
+    """Parse a bulk sale payload (CSV or JSON lines) into a list of dicts."""
+    text = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+    if 'csv' in (content_type or ''):
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            rows.append(json.loads(line))
+    return rows
+
+
+def _validate_row(row):
+    """Normalise a raw sale row, raising ValueError when a field is unusable."""
+    if not isinstance(row, dict):
+        raise ValueError("Each sale must be an object.")
+    missing = [field for field in SALE_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    try:
+        sale_price = Decimal(str(row['sale_price']))
+    except InvalidOperation:
+        raise ValueError(f"Invalid sale price: {row['sale_price']}")
+    if sale_price.is_finite() and 0 < sale_price < MAX_SALE_PRICE:
+        # Rounding to cents can push a value out of range (0.001, 99999999.999)
+        sale_price = sale_price.quantize(Decimal('0.01'))
+    if not (sale_price.is_finite() and 0 < sale_price < MAX_SALE_PRICE):
+        raise ValueError(f"Sale price must be greater than 0 and less than {MAX_SALE_PRICE}.")
+    return {
+        'vehicle_id': int(row['vehicle_id']),
+        'first_name': str(row['first_name']).strip(),
+        'last_name': str(row['last_name']).strip(),
+        'sale_price': sale_price,
+        'sold_at': datetime.strptime(str(row['sold_at']), '%Y-%m-%d').date(),
+    }
+
+
+def _check_idempotency_key(idempotency_key):
+    """Raise ValueError for a key that cannot be stored; it is a bad request, not a conflict."""
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency key must be at most {IDEMPOTENCY_KEY_LENGTH} characters.")
+
+
+def _customers_by_name(names):
+    """Map (first_name, last_name) pairs to the lowest-ID matching customer."""
+    customers = {}
+    candidates = Customer.query.filter(
+        Customer.first_name.in_({first for first, _ in names}),
+        Customer.last_name.in_({last for _, last in names}),
+    ).order_by(Customer.customer_id)
+    for customer in candidates:
+        key = (customer.first_name, customer.last_name)
+        if key in names:
+            customers.setdefault(key, customer)
+    return customers
+
+
+def _bulk_request_hash(rows):
+    """Fingerprint of a bulk sale payload, to tell a retry from a reused idempotency key."""
+    return hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay_bulk(idempotency_key, request_hash):
+    """Return the stored results for a bulk idempotency key, or None if it has not been used."""
+    previous = db.session.get(BulkSaleRequest, idempotency_key)
+    if previous is None:
+        return None
+    if previous.request_hash != request_hash:
+        raise SaleError("This idempotency key was already used for a different batch.")
+    return json.loads(previous.results)
+
+
+def record_bulk_sales(rows, idempotency_key=None):
+    """Record many car sales in one transaction using set-based queries.
+
+    Vehicles and customers are each resolved with a single SELECT, missing
+    customers are inserted in one batch, vehicles are updated with one
+    executemany statement and a sale_recorded outbox event per sale is
+    inserted with another; the outbox worker applies customer totals,
+    sales stats and the rollup. Vehicles that are already sold are
+    rejected per row, as /sell_car rejects them. With an idempotency key
+    the results are stored with the sales, and a retry of the same batch
+    returns them without writing anything. Returns (results, replayed),
+    one result dict per input row. Nothing is committed if a statement
+    fails; SaleError is raised after rolling back when another request
+    sold one of the vehicles first or the key was used for another batch.
+    A malformed idempotency key raises ValueError before anything is read.
+    """
+    _check_idempotency_key(idempotency_key)
+    request_hash = _bulk_request_hash(rows) if idempotency_key else None
+    try:
+        if idempotency_key:
+            replayed = _replay_bulk(idempotency_key, request_hash)
+            if replayed is not None:
+                return replayed, True
+        results = _apply_bulk_sales(rows)
+        if idempotency_key:
+            db.session.add(BulkSaleRequest(idempotency_key=idempotency_key, request_hash=request_hash,
+                                           results=json.dumps(results), created_at=datetime.now()))
+        db.session.commit()
+        return results, False
+    except (SaleError, IntegrityError):
+        db.session.rollback()
+        # A concurrent request with the same key may have committed first
+        if idempotency_key:
+            replayed = _replay_bulk(idempotency_key, request_hash)
+            if replayed is not None:
+                return replayed, True
+        raise
+
+
+def _apply_bulk_sales(rows):
+    """Stage the writes of a bulk sale in the current transaction and return the row results."""
+    results = [None] * len(rows)
+    sales = []
+    seen_vehicles = set()
+    for index, raw in enumerate(rows):
+        try:
+            sale = _validate_row(raw)
+        except (ValueError, TypeError, InvalidOperation, AttributeError) as e:
+            results[index] = {'row': index, 'status': 'error', 'error': str(e)}
+            continue
+        if sale['vehicle_id'] in seen_vehicles:
+            results[index] = {'row': index, 'vehicle_id': sale['vehicle_id'], 'status': 'error',
+                              'error': "Duplicate vehicle in batch."}
+            continue
+        seen_vehicles.add(sale['vehicle_id'])
+        sale['row'] = index
+        sales.append(sale)
+
+    # Resolve every referenced vehicle in one query
+    vehicle_ids = [sale['vehicle_id'] for sale in sales]
+    vehicles = {}
+    if vehicle_ids:
+        # Locked so a concurrent /sell_car for the same vehicles waits for this batch
+        vehicles = {
+            v.vehicle_id: v
+            for v in Vehicle.query.filter(Vehicle.vehicle_id.in_(vehicle_ids)).with_for_update()
+        }
+
+    valid_sales = []
+    for sale in sales:
+        vehicle = vehicles.get(sale['vehicle_id'])
+        if not vehicle:
+            error = "Vehicle not found."
+        elif vehicle.sold_at is not None:
+            error = "Vehicle has already been sold."
+        elif vehicle.purchase_price is None:
+            error = "Vehicle has no purchase price."
+        else:
+            sale['profit'] = sale['sale_price'] - Decimal(vehicle.purchase_price)
+            valid_sales.append(sale)
+            continue
+        results[sale['row']] = {'row': sale['row'], 'vehicle_id': sale['vehicle_id'],
+                                'status': 'error', 'error': error}
+
+    if not valid_sales:
+        return results
+
+    # Resolve customers by name; the IN lists over-select, so match exactly in Python
+    names = {(sale['first_name'], sale['last_name']) for sale in valid_sales}
+    customers = _customers_by_name(names)
+
+    # Create all missing customers with a single batched insert, then read back their IDs
+    new_names = sorted(names - customers.keys())
+    if new_names:
+        today = datetime.now().date()
+        db.session.execute(insert(Customer), [
+            {
+                'first_name': first,
+                'last_name': last,
+                'total_spent': Decimal(0),
+                'total_profit': Decimal(0),
+                'created_at': today,
+                'updated_at': today,
+            }
+            for first, last in new_names
+        ])
+        customers.update(_customers_by_name(new_names))
+
+    customer_ids = {key: customer.customer_id for key, customer in customers.items()}
+    vehicle_updates = []
+    events = []
+    for sale in valid_sales:
+        customer_id = customer_ids[(sale['first_name'], sale['last_name'])]
+        sale['customer_id'] = customer_id
+        vehicle = vehicles[sale['vehicle_id']]
+        events.append(sale_event(vehicle, customer_id, sale, sale['profit']))
+        vehicle_updates.append({
+            'b_vehicle_id': sale['vehicle_id'],
+            'b_sold_at': sale['sold_at'],
+            'b_sale_price': sale['sale_price'],
+            'b_profit': sale['profit'],
+            'b_owner_id': customer_id,
+        })
+
+    # Conditional on the vehicle still being unsold, as in _apply_sale: FOR UPDATE
+    # is a no-op on SQLite, so a concurrent sale could have claimed one since
+    vehicle_table = Vehicle.__table__
+    claimed = db.session.execute(
+        update(vehicle_table)
+        .where(vehicle_table.c.vehicle_id == bindparam('b_vehicle_id'), vehicle_table.c.sold_at.is_(None))
+        .values(sold_at=bindparam('b_sold_at'), sale_price=bindparam('b_sale_price'),
+                profit=bindparam('b_profit'), owner_id=bindparam('b_owner_id')),
+        vehicle_updates,
+    )
+    if claimed.rowcount != len(vehicle_updates) and db.session.get_bind().dialect.supports_sane_multi_rowcount:
+        raise SaleError("Another request sold a vehicle in this batch first; resubmit the batch.")
+    publish_many(SALE_RECORDED, events)
+
+    for sale in valid_sales:
+        results[sale['row']] = {
+            'row': sale['row'],
+            'vehicle_id': sale['vehicle_id'],
+            'customer_id': sale['customer_id'],
+            'status': 'ok',
+            'profit': f"{sale['profit']:.2f}",
+        }
+    return results
+
+
+def sale_event(vehicle, customer_id, sale, profit):
+    """Payload of a sale_recorded event."""
+    return {
+        'vehicle_id': vehicle.vehicle_id,
+        'customer_id': customer_id,
+        'make': vehicle.make,
+        'model': vehicle.model,
+        'sold_at': sale['sold_at'].isoformat(),
+        'sale_price': str(sale['sale_price']),
+        'profit': str(profit),
+    }
+
+
+@handles(SALE_RECORDED)
+def apply_sale_events(payloads):
+    """Add a batch of sales to customer totals, sales stats and the daily rollup.
+
+    Runs in the outbox worker's transaction. Totals are accumulated per
+    customer and per vehicle first, so a batch costs one UPDATE per
+    customer and stats row rather than one per sale; customer totals are
+    incremented in SQL so concurrent workers cannot lose an update.
+    """
+    today = datetime.now().date()
+    customer_totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    vehicle_totals = {}
+    rollup_deltas = new_deltas()
+    for payload in payloads:
+        sold_at = date.fromisoformat(payload['sold_at'])
+        sale_price, profit = Decimal(payload['sale_price']), Decimal(payload['profit'])
+        totals = customer_totals[payload['customer_id']]
+        totals[0] += sale_price
+        totals[1] += profit
+        totals = vehicle_totals.setdefault(payload['vehicle_id'], {
+            'cars_sold': 0, 'total_profit': Decimal(0), 'start_date': sold_at,
+        })
+        totals['cars_sold'] += 1
+        totals['total_profit'] += profit
+        totals['end_date'] = sold_at
+        sale_delta(rollup_deltas, sold_at, payload['make'], payload['model'], profit)
+
+    customer = Customer.__table__
+    db.session.execute(
+        update(customer).where(customer.c.customer_id == bindparam('b_customer_id')).values(
+            total_spent=db.func.coalesce(customer.c.total_spent, 0) + bindparam('b_spent'),
+            total_profit=db.func.coalesce(customer.c.total_profit, 0) + bindparam('b_profit'),
+            updated_at=today,
+        ),
+        [{'b_customer_id': customer_id, 'b_spent': spent, 'b_profit': profit}
+         for customer_id, (spent, profit) in customer_totals.items()],
+    )
+
+    # Existing stats rows, first row per vehicle as sell_car always used
+    stats_by_vehicle = {}
+    existing_stats = SalesStats.query.filter(
+        SalesStats.vehicle_stat_id.in_(list(vehicle_totals))
+    ).order_by(SalesStats.stats_id).with_for_update()
+    for stats in existing_stats:
+        stats_by_vehicle.setdefault(stats.vehicle_stat_id, stats)
+
+    stats_updates = []
+    stats_inserts = []
+    now = datetime.now()
+    for vehicle_id, totals in vehicle_totals.items():
+        stats = stats_by_vehicle.get(vehicle_id)
+        if stats:
+            stats_updates.append({
+                'stats_id': stats.stats_id,
+                'cars_sold': (stats.cars_sold or 0) + totals['cars_sold'],
+                'total_profit': (stats.total_profit or Decimal(0)) + totals['total_profit'],
+                'end_date': totals['end_date'],
+            })
+        else:
+            stats_inserts.append(dict(totals, vehicle_stat_id=vehicle_id, created_at=now))
+    if stats_updates:
+        db.session.execute(update(SalesStats), stats_updates)
+    if stats_inserts:
+        db.session.execute(insert(SalesStats), stats_inserts)
+    apply_deltas(rollup_deltas)
+
+
+def _request_hash(sale):
+    """Fingerprint of a validated sale, to tell a retry from a reused idempotency key."""
+    payload = json.dumps({field: str(sale[field]) for field in SALE_FIELDS}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(idempotency_key, request_hash):
+    """Return the stored result for an idempotency key, or None if it has not been used."""
+    previous = db.session.get(SaleRequest, idempotency_key)
+    if previous is None:
+        return None
+    if previous.request_hash != request_hash:
+        raise SaleError("This idempotency key was already used for a different sale.")
+    return {'vehicle_id': previous.vehicle_id, 'customer_id': previous.customer_id, 'replayed': True}
+
+
+def _is_transient(error):
+    orig = error.orig
+    code = orig.args[0] if orig is not None and orig.args else None
+    return code in TRANSIENT_ERROR_CODES or 'database is locked' in str(orig)
+
+
+def _apply_sale(sale, idempotency_key, request_hash):
+    """Stage the writes of one sale in the current transaction; the caller commits."""
+    vehicle = db.session.execute(
+        db.select(Vehicle).where(Vehicle.vehicle_id == sale['vehicle_id']).with_for_update()
+    ).scalar_one_or_none()
+    if vehicle is None:
+        raise SaleError("Vehicle not found.")
+    if vehicle.sold_at is not None:
+        raise SaleError("Vehicle has already been sold.")
+    if vehicle.purchase_price is None:
+        raise SaleError("Vehicle has no purchase price.")
+
+    today = datetime.now().date()
+    customer = Customer.query.filter_by(
+        first_name=sale['first_name'], last_name=sale['last_name']
+    ).order_by(Customer.customer_id).first()
+    if not customer:
+        customer = Customer(
+            first_name=sale['first_name'],
+            last_name=sale['last_name'],
+            total_spent=Decimal(0),
+            total_profit=Decimal(0),
+            created_at=today,
+            updated_at=today,
+        )
+        db.session.add(customer)
+        db.session.flush()
+        logging.info(f"New customer added: {customer.first_name} {customer.last_name} "
+                     f"(ID: {customer.customer_id})")
+
+    # FOR UPDATE is a no-op on SQLite, so the sale is also conditional on the
+    # vehicle still being unsold; only one of two racing sales matches.
+    profit = sale['sale_price'] - Decimal(vehicle.purchase_price)
+    claimed = db.session.execute(
+        update(Vehicle)
+        .where(Vehicle.vehicle_id == vehicle.vehicle_id, Vehicle.sold_at.is_(None))
+        .values(sold_at=sale['sold_at'], sale_price=sale['sale_price'], profit=profit,
+                owner_id=customer.customer_id)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        raise SaleError("Vehicle has already been sold.")
+
+    # Customer totals, sales stats and the rollup follow via the outbox worker
+    publish(SALE_RECORDED, sale_event(vehicle, customer.customer_id, sale, profit))
+    if idempotency_key:
+        db.session.add(SaleRequest(
+            idempotency_key=idempotency_key,
+            request_hash=request_hash,
+            vehicle_id=vehicle.vehicle_id,
+            customer_id=customer.customer_id,
+            created_at=datetime.now(),
+        ))
+    return {'vehicle_id': vehicle.vehicle_id, 'customer_id': customer.customer_id, 'replayed': False}
+
+
+def sell_vehicle(row, idempotency_key=None):
+    """Record one car sale in a single transaction.
+
+    The customer (if new), the vehicle, the sale_recorded outbox event and
+    the idempotency record commit together. The vehicle row is locked and
+    must still be unsold, so of several concurrent submissions for one
+    vehicle exactly one is recorded. With an idempotency key, a retry of a
+    recorded sale returns the original result (replayed=True) without
+    writing anything. Deadlocks and lock timeouts are retried; rejected
+    sales raise SaleError after rolling back, and a malformed idempotency
+    key raises ValueError. Returns {'vehicle_id', 'customer_id', 'replayed'}.
+    """
+    try:
+        sale = _validate_row(row)
+    except (ValueError, TypeError, InvalidOperation, AttributeError) as e:
+        raise SaleError(str(e))
+    _check_idempotency_key(idempotency_key)
+    request_hash = _request_hash(sale) if idempotency_key else None
+
+    for attempt in range(1, SALE_RETRIES + 1):
+        try:
+            if idempotency_key:
+                replayed = _replay(idempotency_key, request_hash)
+                if replayed:
+                    return replayed
+            result = _apply_sale(sale, idempotency_key, request_hash)
+            db.session.commit()
+            return result
+        except (SaleError, IntegrityError):
+            db.session.rollback()
+            # A concurrent request with the same key may have committed first
+            if idempotency_key:
+                replayed = _replay(idempotency_key, request_hash)
+                if replayed:
+                    return replayed
+            raise
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == SALE_RETRIES or not _is_transient(e):
+                raise
+            logging.warning(f"Retrying sale of Vehicle ID {sale['vehicle_id']} "
+                            f"after lock conflict (attempt {attempt}): {e.orig}")
+        except Exception:
+            db.session.rollback()
+            raise
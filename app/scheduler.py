@@ -0,0 +1,233 @@
+import math
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import date, time, timedelta
+from time import monotonic
+
+from app.models import db, ServiceAppointment
+
+MINUTES_PER_DAY = 24 * 60
+DAY_LOCK_STRIPES = 64
+
+
+def to_minutes(value):
+    """Convert a datetime.time to minutes since midnight."""
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    """Convert minutes since midnight back to a datetime.time."""
+    return time(minutes // 60, minutes % 60)
+
+
+class SlotIndex:
+    """Per-day bay occupancy counts over fixed-size time slots.
+
+    Each day is a compact array holding the number of busy bays per slot,
+    so capacity checks and free-slot searches only touch the slots of one
+    day. Callers hold the owning scheduler's lock.
+    """
+
+    def __init__(self, bays, slot_minutes, open_minute, close_minute):
+        self.bays = bays
+        self.slot_minutes = slot_minutes
+        self.open_minute = open_minute
+        self.close_minute = close_minute
+        self.slots_per_day = MINUTES_PER_DAY // slot_minutes
+        self.days = {}
+
+    def _slots(self, start, end):
+        first = start // self.slot_minutes
+        last = min(math.ceil(end / self.slot_minutes), self.slots_per_day)
+        return first, max(last, first + 1)
+
+    def day(self, day):
+        counts = self.days.get(day)
+        if counts is None:
+            counts = self.days[day] = array('H', bytes(2 * self.slots_per_day))
+        return counts
+
+    def load_day(self, day, intervals):
+        """Replace a day's occupancy with the given (start, end) minute intervals."""
+        self.days[day] = array('H', bytes(2 * self.slots_per_day))
+        for start, end in intervals:
+            self.add(day, start, end)
+
+    def add(self, day, start, end, delta=1):
+        counts = self.day(day)
+        first, last = self._slots(start, end)
+        for slot in range(first, last):
+            counts[slot] = max(counts[slot] + delta, 0)
+
+    def is_free(self, day, start, end):
+        counts = self.days.get(day)
+        if counts is None:
+            return True
+        first, last = self._slots(start, end)
+        return max(counts[first:last]) < self.bays
+
+    def next_free(self, day, duration, after=None):
+        """Return the earliest start minute on day with a bay free for duration, or None."""
+        counts = self.days.get(day)
+        start = max(after if after is not None else 0, self.open_minute)
+        start = math.ceil(start / self.slot_minutes) * self.slot_minutes
+        if counts is None:
+            return start if start + duration <= self.close_minute else None
+        width = math.ceil(duration / self.slot_minutes)
+        slot = start // self.slot_minutes
+        last_start = (self.close_minute - duration) // self.slot_minutes
+        while slot <= last_start:
+            # Jump past the last full slot in the window instead of sliding by one
+            full = [i for i in range(slot, slot + width) if counts[i] >= self.bays]
+            if not full:
+                return slot * self.slot_minutes
+            slot = full[-1] + 1
+        return None
+
+    def utilisation(self, day):
+        """Fraction of bay-slots in opening hours that are booked on day."""
+        counts = self.days.get(day)
+        first, last = self._slots(self.open_minute, self.close_minute)
+        if counts is None or last <= first:
+            return 0.0
+        window = counts[first:last]
+        if max(window) <= self.bays:
+            busy = sum(window)
+        else:
+            busy = sum(min(count, self.bays) for count in window)
+        return busy / (self.bays * (last - first))
+
+
+class ServiceScheduler:
+    """Capacity-aware service bay scheduler backed by an in-memory SlotIndex.
+
+    The index is built from upcoming appointments with one query on first
+    use. Each worker process holds its own copy, so bookings made through
+    another worker show up once the index is older than max_age and is
+    reloaded. Bookings re-read the day's appointments with a locking read
+    inside the caller's transaction, so workers with stale indexes cannot
+    overbook.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # A fixed set of locks shared by dates, so there is no lock per date kept forever
+        self._day_locks = [threading.Lock() for _ in range(DAY_LOCK_STRIPES)]
+        self.configure()
+
+    def configure(self, bays=4, slot_minutes=15, open_hour=8, close_hour=18,
+                  default_duration=60, package_durations=None, max_age=30):
+        with self._lock:
+            self.default_duration = default_duration
+            self.package_durations = {int(k): v for k, v in (package_durations or {}).items()}
+            self.index = SlotIndex(bays, slot_minutes, open_hour * 60, close_hour * 60)
+            self.max_age = max_age
+            self.loaded_at = None
+
+    def duration_for(self, package_id):
+        """Expected service length in minutes for a package."""
+        return self.package_durations.get(int(package_id), self.default_duration)
+
+    def _interval(self, arrival_time, completion_time):
+        start = to_minutes(arrival_time)
+        end = to_minutes(completion_time) if completion_time else 0
+        if end <= start:
+            end = min(start + self.default_duration, MINUTES_PER_DAY)
+        return start, end
+
+    def rebuild(self, from_date=None):
+        """Reload the index for every appointment on or after from_date (default today)."""
+        from_date = from_date or date.today()
+        rows = db.session.execute(
+            db.select(ServiceAppointment.appt_date, ServiceAppointment.arrival_time,
+                      ServiceAppointment.completion_time)
+            .where(ServiceAppointment.appt_date >= from_date)
+        )
+        by_day = {}
+        for appt_date, arrival_time, completion_time in rows:
+            if arrival_time is not None:
+                by_day.setdefault(appt_date, []).append(self._interval(arrival_time, completion_time))
+        with self._lock:
+            self.index.days.clear()
+            for day, intervals in by_day.items():
+                self.index.load_day(day, intervals)
+            self.loaded_at = monotonic()
+        return sum(len(intervals) for intervals in by_day.values())
+
+    def _ensure_loaded(self):
+        """Load the index if it is missing or older than max_age."""
+        with self._lock:
+            fresh = self.loaded_at is not None and (
+                not self.max_age or monotonic() - self.loaded_at < self.max_age
+            )
+        if not fresh:
+            self.rebuild()
+
+    def _day_lock(self, day):
+        return self._day_locks[day.toordinal() % DAY_LOCK_STRIPES]
+
+    @contextmanager
+    def booking(self, appt_date, arrival_time, duration):
+        """Claim a bay for an appointment committed inside the with-block.
+
+        Yields the expected completion time, or None when every bay is busy
+        or the slot falls outside opening hours. Bookings for the same day
+        are serialised: in-process by a per-day lock held until the block
+        exits, and across workers by reading the day's appointments with
+        FOR UPDATE in the caller's transaction. If the block raises, the
+        reservation is removed from the index again.
+        """
+        self._ensure_loaded()
+        start = to_minutes(arrival_time)
+        end = start + duration
+        if start < self.index.open_minute or end > self.index.close_minute:
+            yield None
+            return
+
+        with self._day_lock(appt_date):
+            rows = db.session.execute(
+                db.select(ServiceAppointment.arrival_time, ServiceAppointment.completion_time)
+                .where(ServiceAppointment.appt_date == appt_date)
+                .with_for_update()
+            ).all()
+            intervals = [self._interval(a, c) for a, c in rows if a is not None]
+            with self._lock:
+                self.index.load_day(appt_date, intervals)
+                free = self.index.is_free(appt_date, start, end)
+                if free:
+                    self.index.add(appt_date, start, end)
+            if not free:
+                yield None
+                return
+            try:
+                yield to_time(min(end, MINUTES_PER_DAY - 1))
+            except BaseException:
+                with self._lock:
+                    self.index.add(appt_date, start, end, delta=-1)
+                raise
+
+    def next_free_slot(self, package_id, from_date, after_time=None, max_days=14):
+        """Return (date, time) of the earliest slot that fits the package, or None."""
+        self._ensure_loaded()
+        duration = self.duration_for(package_id)
+        after = to_minutes(after_time) if after_time else None
+        with self._lock:
+            for offset in range(max_days):
+                day = from_date + timedelta(days=offset)
+                start = self.index.next_free(day, duration, after if offset == 0 else None)
+                if start is not None:
+                    return day, to_time(start)
+        return None
+
+    def utilisation(self, start_date, days=7):
+        """Return the booked fraction of bay time for each day in the range."""
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                start_date + timedelta(days=offset): self.index.utilisation(start_date + timedelta(days=offset))
+                for offset in range(days)
+            }
+
+
+service_scheduler = ServiceScheduler()
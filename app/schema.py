@@ -0,0 +1,130 @@
+import hashlib
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.models import db, Customer, Vehicle, ServiceAppointment, SchemaVersion
+
+SCHEMA_VERSION_ID = 1
+
+
+def missing_indexes():
+    """Return model-declared indexes that do not exist in the connected database."""
+    inspector = inspect(db.engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def ensure_indexes():
+    """Create any missing model indexes and return their names."""
+    created = []
+    for index in missing_indexes():
+        index.create(bind=db.engine)
+        created.append(index.name)
+    return created
+
+
+def schema_fingerprint(dialect):
+    """Hash of the CREATE TABLE and CREATE INDEX statements the models compile to."""
+    digest = hashlib.sha256()
+    for table in db.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()
+
+
+def stored_fingerprint():
+    """The fingerprint recorded when the schema was last applied, or None."""
+    # A Core query on its own connection, so booting doesn't configure every ORM mapper
+    table = SchemaVersion.__table__
+    try:
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(table.c.fingerprint).where(table.c.schema_version_id == SCHEMA_VERSION_ID)
+            ).scalar()
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet: a new database, or one created before it existed
+        return None
+
+
+def ensure_schema(force=False):
+    """Create missing tables and indexes unless the stored fingerprint matches the models.
+
+    Returns True when the schema was applied. On an up-to-date database this
+    is one primary-key lookup, where create_all reflects every table.
+    """
+    fingerprint = schema_fingerprint(db.engine.dialect)
+    if not force and stored_fingerprint() == fingerprint:
+        return False
+    db.create_all(bind_key=None)  # Replicas get the tables by replication
+    ensure_indexes()
+    db.session.merge(SchemaVersion(schema_version_id=SCHEMA_VERSION_ID, fingerprint=fingerprint,
+                                   applied_at=datetime.now()))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker booting at the same time recorded it first
+        db.session.rollback()
+    return True
+
+
+def hot_queries():
+    """The lookups the indexes exist for, with representative literal values."""
+    return {
+        "customer by name": select(Customer).where(
+            Customer.first_name == 'Liam', Customer.last_name == 'Miller'),
+        "vehicles sold in range": select(Vehicle).where(
+            Vehicle.sold_at.between(date(2023, 1, 1), date(2023, 12, 31))),
+        "vehicles by make/model": select(Vehicle).where(
+            Vehicle.make == 'Toyota', Vehicle.model == 'Camry'),
+        "vehicles by owner": select(Vehicle).where(Vehicle.owner_id == 1),
+        "appointments by customer": select(ServiceAppointment).where(
+            ServiceAppointment.service_customer_id == 1),
+        "appointments by vehicle": select(ServiceAppointment).where(
+            ServiceAppointment.vehicle_serviced_id == 1),
+    }
+
+
+def explain(statement):
+    """Return the database's query plan for a statement as a list of text rows."""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN" if dialect.name == 'sqlite' else "EXPLAIN"
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"{prefix} {sql}").fetchall()
+    return [" | ".join(str(value) for value in row) for row in rows]
+
+
+@click.command('migrate-indexes')
+@click.option('--explain-only', is_flag=True, help="Only print query plans; do not create indexes.")
+@with_appcontext
+def migrate_indexes_command(explain_only):
+    """Create missing lookup indexes and print query plans for the hot lookups."""
+    if not explain_only:
+        created = ensure_indexes()
+        click.echo(f"Created indexes: {', '.join(created)}" if created else "All indexes present.")
+    for name, statement in hot_queries().items():
+        click.echo(f"\n{name}:")
+        for line in explain(statement):
+            click.echo(f"  {line}")
+
+
+@click.command('ensure-schema')
+@click.option('--force', is_flag=True, help="Apply the schema even if the stored fingerprint matches.")
+@with_appcontext
+def ensure_schema_command(force):
+    """Create missing tables and indexes when the models have changed."""
+    if ensure_schema(force):
+        click.echo("Schema applied.")
+    else:
+        click.echo("Schema is up to date.")
@@ -0,0 +1,290 @@
+import logging
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from app.models import db, Vehicle
+
+FACETS = ('make', 'model', 'year', 'price_band', 'status')
+PRICE_BANDS = (0, 10_000, 20_000, 30_000, 40_000, 50_000, 75_000, 100_000)
+REBUILD_BATCH_SIZE = 5000
+
+
+def price_band(price):
+    """Return the band label ('20000-30000', '100000+') a price falls in."""
+    if price is None:
+        return None
+    index = max(bisect_right(PRICE_BANDS, price) - 1, 0)
+    if index + 1 == len(PRICE_BANDS):
+        return f"{PRICE_BANDS[index]}+"
+    return f"{PRICE_BANDS[index]}-{PRICE_BANDS[index + 1]}"
+
+
+def index_row(vehicle):
+    """Flatten a Vehicle into the (vehicle_id, make, model, year, price, sold) row the index stores.
+
+    price is the sale price for sold vehicles and the purchase price for stock.
+    """
+    sold = vehicle.sold_at is not None
+    price = vehicle.sale_price if sold else vehicle.purchase_price
+    return (vehicle.vehicle_id, vehicle.make, vehicle.model, vehicle.year,
+            None if price is None else float(price), sold)
+
+
+def facet_values(row):
+    """Return a row's value for each facet, in FACETS order (None when unknown)."""
+    _, make, model, year, price, sold = row
+    return make, model, year, price_band(price), 'sold' if sold else 'unsold'
+
+
+class InventoryColumns:
+    """Columnar vehicle data plus one bitmap per facet value.
+
+    Every vehicle occupies a slot. Facet values are dictionary-encoded into
+    compact code arrays, and bitmaps[facet][code] is a Python int with bit
+    `slot` set for each vehicle holding that value. Bitmaps span the whole
+    table, so memory is roughly distinct values x vehicles / 8 bytes.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.prices = array('d')
+        self.codes = {facet: array('I') for facet in FACETS}
+        self.labels = {facet: [None] for facet in FACETS}  # code 0 means "unknown"
+        self.lookup = {facet: {} for facet in FACETS}
+        self.bitmaps = {facet: {} for facet in FACETS}
+        self.slots = {}
+        self.everything = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def code_for(self, facet, value):
+        if value is None:
+            return 0
+        code = self.lookup[facet].get(str(value))
+        if code is None:
+            code = self.lookup[facet][str(value)] = len(self.labels[facet])
+            self.labels[facet].append(value)
+        return code
+
+    def extend(self, rows):
+        """Append index rows; bitmaps are built afterwards by build_bitmaps."""
+        ids, prices, slots = self.ids, self.prices, self.slots
+        columns = [(self.codes[facet], self.lookup[facet], self.labels[facet]) for facet in FACETS]
+        for row in rows:
+            slots[row[0]] = len(ids)
+            ids.append(row[0])
+            prices.append(math.nan if row[4] is None else row[4])
+            for (codes, lookup, labels), value in zip(columns, facet_values(row)):
+                if value is None:
+                    codes.append(0)
+                    continue
+                key = str(value)
+                code = lookup.get(key)
+                if code is None:
+                    code = lookup[key] = len(labels)
+                    labels.append(value)
+                codes.append(code)
+
+    def build_bitmaps(self):
+        """Derive every facet bitmap from the code arrays in one pass per facet."""
+        size = (len(self.ids) + 7) // 8
+        for facet in FACETS:
+            buffers = {}
+            for slot, code in enumerate(self.codes[facet]):
+                if code:
+                    buffer = buffers.get(code)
+                    if buffer is None:
+                        buffer = buffers[code] = bytearray(size)
+                    buffer[slot >> 3] |= 1 << (slot & 7)
+            self.bitmaps[facet] = {code: int.from_bytes(buffer, 'little') for code, buffer in buffers.items()}
+        self.everything = (1 << len(self.ids)) - 1
+
+    def update(self, row):
+        """Move one vehicle to its current facet values, appending it if new."""
+        slot = self.slots.get(row[0])
+        if slot is None:
+            slot = len(self.ids)
+            self.extend([row])
+            bit = 1 << slot
+            self.everything |= bit
+            for facet in FACETS:
+                code = self.codes[facet][slot]
+                if code:
+                    self.bitmaps[facet][code] = self.bitmaps[facet].get(code, 0) | bit
+            return
+        bit = 1 << slot
+        self.prices[slot] = math.nan if row[4] is None else row[4]
+        for facet, value in zip(FACETS, facet_values(row)):
+            old, new = self.codes[facet][slot], self.code_for(facet, value)
+            if old == new:
+                continue
+            if old:
+                remaining = self.bitmaps[facet][old] & ~bit
+                if remaining:
+                    self.bitmaps[facet][old] = remaining
+                else:
+                    del self.bitmaps[facet][old]
+            if new:
+                self.bitmaps[facet][new] = self.bitmaps[facet].get(new, 0) | bit
+            self.codes[facet][slot] = new
+
+    def row(self, slot):
+        price = self.prices[slot]
+        return {
+            'vehicle_id': self.ids[slot],
+            'make': self.labels['make'][self.codes['make'][slot]],
+            'model': self.labels['model'][self.codes['model'][slot]],
+            'year': self.labels['year'][self.codes['year'][slot]],
+            'price': None if math.isnan(price) else round(price, 2),
+            'status': self.labels['status'][self.codes['status'][slot]],
+        }
+
+
+def iter_slots(mask, skip=0, limit=None):
+    """Yield the positions of set bits in mask, lowest first."""
+    bits = format(mask, 'b')[::-1]
+    position = bits.find('1')
+    while position != -1 and skip:
+        position = bits.find('1', position + 1)
+        skip -= 1
+    while position != -1 and (limit is None or limit > 0):
+        yield position
+        position = bits.find('1', position + 1)
+        if limit is not None:
+            limit -= 1
+
+
+class InventoryIndex:
+    """Faceted vehicle search served from memory.
+
+    The whole table is loaded with one streamed query at startup (or on the
+    first search) and kept current by update()/refresh() after sales commit.
+    Each worker process holds its own copy, so sales made through another
+    worker show up once the index is older than max_age and is rebuilt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.RLock()
+        self.configure()
+
+    def configure(self, max_age=300):
+        with self._lock:
+            self.max_age = max_age
+            self.columns = None
+            self.built_at = None
+            self.build_seconds = None
+
+    def rebuild(self):
+        """Load every vehicle and swap in freshly built columns and bitmaps."""
+        with self._rebuild_lock:
+            start = time.perf_counter()
+            columns = InventoryColumns()
+            # Price and sold flag are computed in SQL so rows need no Decimal or date parsing
+            sold = Vehicle.sold_at.isnot(None)
+            query = db.select(
+                Vehicle.vehicle_id, Vehicle.make, Vehicle.model, Vehicle.year,
+                db.type_coerce(db.case((sold, Vehicle.sale_price), else_=Vehicle.purchase_price), db.Float),
+                sold,
+            ).order_by(Vehicle.vehicle_id)
+            result = db.session.connection().execution_options(yield_per=REBUILD_BATCH_SIZE).execute(query)
+            columns.extend(result)
+            columns.build_bitmaps()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.columns = columns
+                self.built_at = time.monotonic()
+                self.build_seconds = elapsed
+        logging.info(f"Inventory index built: {len(columns)} vehicles in {elapsed:.3f}s")
+        return len(columns)
+
+    def _fresh(self):
+        with self._lock:
+            return self.columns is not None and (
+                not self.max_age or time.monotonic() - self.built_at < self.max_age
+            )
+
+    def ensure_built(self):
+        """Build the index if it is missing or older than max_age."""
+        if self._fresh():
+            return
+        with self._rebuild_lock:
+            # Another thread may have rebuilt while this one waited
+            if not self._fresh():
+                self.rebuild()
+
+    def update(self, vehicle):
+        """Apply a committed change to one vehicle; no-op until the index is built."""
+        with self._lock:
+            if self.columns is not None:
+                self.columns.update(index_row(vehicle))
+
+    def refresh(self, vehicle_ids):
+        """Re-read the given vehicles with one query and apply their current values."""
+        if self.columns is None or not vehicle_ids:
+            return
+        for vehicle in Vehicle.query.filter(Vehicle.vehicle_id.in_(list(vehicle_ids))):
+            self.update(vehicle)
+
+    def facet_labels(self, facet):
+        """Return the known values of a facet."""
+        self.ensure_built()
+        with self._lock:
+            return self.columns.labels[facet][1:]
+
+    def search(self, filters, limit=50, offset=0):
+        """Return matching vehicles and per-facet counts.
+
+        filters maps facet names to accepted values; values within a facet
+        are ORed and facets are ANDed. Each facet's counts apply the filters
+        of every other facet, so they show what choosing that value gives.
+        """
+        self.ensure_built()
+        with self._lock:
+            columns = self.columns
+            masks = {}
+            for facet, values in filters.items():
+                mask = 0
+                for value in values:
+                    code = columns.lookup[facet].get(str(value))
+                    if code is not None:
+                        mask |= columns.bitmaps[facet].get(code, 0)
+                masks[facet] = mask
+
+            matches = columns.everything
+            for mask in masks.values():
+                matches &= mask
+
+            counts = {}
+            for facet in FACETS:
+                base = columns.everything
+                for other, mask in masks.items():
+                    if other != facet:
+                        base &= mask
+                labels = columns.labels[facet]
+                counts[facet] = {
+                    str(labels[code]): count
+                    for code, bitmap in columns.bitmaps[facet].items()
+                    if (count := (bitmap & base).bit_count())
+                }
+
+            return {
+                'total': matches.bit_count(),
+                'facets': counts,
+                'results': [columns.row(slot) for slot in iter_slots(matches, offset, limit)],
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'vehicles': len(self.columns) if self.columns is not None else 0,
+                'build_seconds': self.build_seconds,
+                'age_seconds': None if self.built_at is None else time.monotonic() - self.built_at,
+            }
+
+
+inventory_index = InventoryIndex()
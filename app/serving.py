@@ -0,0 +1,53 @@
+import logging
+import time
+
+from sqlalchemy import text
+
+from app import db
+
+
+def warm_up(app):
+    """Open the connection pool, probe replicas, compile templates and build the inventory index.
+
+    Checks out pool_size connections at once so each is established (and
+    pre-pinged) up front, records each read replica's health so the first
+    reads can use them, compiles every Jinja template into the
+    environment's cache and loads the vehicle search index. Returns the
+    time taken in seconds.
+    """
+    start = time.perf_counter()
+    with app.app_context():
+        pool_size = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('pool_size', 1)
+        connections = []
+        try:
+            for _ in range(pool_size):
+                connection = db.engine.connect()
+                connection.execute(text('SELECT 1'))
+                connections.append(connection)
+        finally:
+            for connection in connections:
+                connection.close()
+
+        from app.routing import replica_router
+        replica_router.check_all()
+
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+        from app.search import inventory_index
+        inventory_index.rebuild()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Warm-up complete: {pool_size} connections, templates compiled in {elapsed:.3f}s")
+    return elapsed
+
+
+def shutdown(app):
+    """Release pooled connections and stop the bill render pool and replica health checks."""
+    from app.billing import bill_renderer
+    from app.routing import replica_router
+    bill_renderer.shutdown()
+    replica_router.stop_thread()
+    with app.app_context():
+        db.engine.dispose()
+    logging.info("Shutdown complete: connections closed, render pool stopped.")
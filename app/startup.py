@@ -0,0 +1,78 @@
+import os
+import re
+import subprocess
+import sys
+import time
+import types
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+# Heavy modules deferred with utils.lazy_import until a bill or analytics request needs them
+LAZY_MODULES = ('numpy', 'reportlab.pdfgen.canvas')
+
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)")
+
+
+class StartupProfile:
+    """Milliseconds spent in each phase of create_app, in order."""
+
+    def __init__(self):
+        self.phases = {}
+        self._last = time.perf_counter()
+
+    def start(self):
+        self.phases = {}
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """End the current phase, naming it, and start timing the next."""
+        now = time.perf_counter()
+        self.phases[phase] = (now - self._last) * 1000
+        self._last = now
+
+    def total(self):
+        return sum(self.phases.values())
+
+
+startup_profile = StartupProfile()
+
+
+def loaded_lazy_modules():
+    """The LAZY_MODULES whose code has run in this process."""
+    # A lazy module stays a _LazyModule until first use, then becomes a plain module
+    return [name for name in LAZY_MODULES if type(sys.modules.get(name)) is types.ModuleType]
+
+
+def import_profile(code="from app import create_app; create_app()", cwd=None):
+    """Import self time in ms per top-level package, measured in a fresh interpreter.
+
+    Runs code under python -X importtime, so the numbers are those of a cold
+    worker, not of this already warmed-up process. Sorted slowest first.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            packages[match.group(2).split('.')[0]] += int(match.group(1)) / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+@click.command('startup-profile')
+@click.option('--top', default=15, help="Number of packages to list.")
+@with_appcontext
+def startup_profile_command(top):
+    """Show where boot time goes: imports by package and create_app phases."""
+    packages = import_profile(cwd=os.path.dirname(current_app.root_path))
+    click.echo(f"Imports (fresh interpreter): {sum(ms for _, ms in packages):.1f} ms")
+    for package, ms in packages[:top]:
+        click.echo(f"  {package:<28} {ms:8.1f} ms")
+    click.echo(f"\ncreate_app: {startup_profile.total():.1f} ms")
+    for phase, ms in startup_profile.phases.items():
+        click.echo(f"  {phase:<28} {ms:8.1f} ms")
+    loaded = loaded_lazy_modules()
+    click.echo(f"\nLazy modules loaded: {', '.join(loaded) if loaded else 'none'}")
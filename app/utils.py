@@ -1,4 +1,7 @@
-from datetime import datetime
+import importlib.util
+import sys
+from datetime import date, datetime, time
+from decimal import Decimal
 
 def parse_date(date_string):
     """Parse a string into a Python datetime.date object."""
@@ -14,3 +17,23 @@ def calculate_total_profit(sale_price, purchase_price):
 def format_currency(value):
     """Format a number as currency."""
     return f"${value:,.2f}"
+
+def to_json_value(value):
+    """Convert database values (Decimal, date, time) to JSON-safe primitives."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+def lazy_import(name):
+    """Return a module that is only executed when one of its attributes is first used."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
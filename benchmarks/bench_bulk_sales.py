@@ -0,0 +1,96 @@
+"""Compare the per-request /sell_car path with the /sales/bulk endpoint.
+
+Usage: python benchmarks/bench_bulk_sales.py [--rows N] [--database-uri URI] [--drop]
+
+Each path runs against a freshly seeded database so both record the same
+sales. Defaults to a temporary SQLite file.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+
+from common import make_config, require_drop_consent
+from app import create_app, db
+from app.models import Customer, Vehicle
+
+
+def seed(rows):
+    db.drop_all()
+    db.create_all()
+    dealer = Customer(customer_id=1, first_name='Dealer', last_name='Stock',
+                      total_spent=Decimal(0), total_profit=Decimal(0))
+    db.session.add(dealer)
+    db.session.add_all(
+        Vehicle(vehicle_id=i, make='Toyota', model='Camry', year=2015, vin=f'BENCH{i:012d}',
+                purchase_price=Decimal('10000.00'), owner_id=1, created_at=date.today())
+        for i in range(1, rows + 1)
+    )
+    db.session.commit()
+
+
+def sales(rows):
+    # Half of the buyers repeat so both the lookup and the create path are exercised
+    return [
+        {
+            'vehicle_id': str(i),
+            'first_name': f'Buyer{i % (rows // 2 or 1)}',
+            'last_name': 'Bench',
+            'sale_price': '12500.00',
+            'sold_at': '2024-06-01',
+        }
+        for i in range(1, rows + 1)
+    ]
+
+
+def run_single(app, rows):
+    with app.app_context():
+        seed(rows)
+    client = app.test_client()
+    start = time.perf_counter()
+    for sale in sales(rows):
+        client.post('/sell_car', data=sale)
+    return time.perf_counter() - start
+
+
+def run_bulk(app, rows):
+    with app.app_context():
+        seed(rows)
+    client = app.test_client()
+    payload = '\n'.join(json.dumps(sale) for sale in sales(rows))
+    start = time.perf_counter()
+    response = client.post('/sales/bulk', data=payload, content_type='application/x-ndjson')
+    elapsed = time.perf_counter() - start
+    assert response.get_json()['succeeded'] == rows, response.get_json()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--drop', action='store_true',
+                        help="Allow dropping all tables in a non-SQLite --database-uri.")
+    args = parser.parse_args()
+    if args.database_uri:
+        require_drop_consent(args.database_uri, args.drop)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database_uri or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app(make_config(uri))
+        single = run_single(app, args.rows)
+        bulk = run_bulk(app, args.rows)
+        with app.app_context():
+            db.engine.dispose()
+
+    print(f"rows: {args.rows}")
+    print(f"per-request /sell_car: {single:.3f}s ({args.rows / single:.0f} sales/s)")
+    print(f"bulk /sales/bulk:      {bulk:.3f}s ({args.rows / bulk:.0f} sales/s)")
+    print(f"speedup: {single / bulk:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Stress /sell_car with concurrent, conflicting and retried submissions.
+
+Usage: python benchmarks/bench_sale_contention.py [--vehicles N] [--contenders N]
+       [--buyers N] [--threads 1,4,8,16] [--database-uri URI] [--drop]
+
+Every vehicle receives several competing sales from different buyers, and
+each submission is sent twice with the same idempotency key (a browser
+retry), all shuffled across a thread pool. After each run the outbox is
+drained and the database checked: every vehicle sold once, customer
+totals equal the sum of their purchases, sales stats and the daily rollup
+agree with the vehicle table, and every stored idempotency key points at
+the sale it recorded. Exits 1
+if any check fails. Defaults to a temporary SQLite file; pass a MySQL URI
+to exercise real row locks.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from common import make_config, percentile, require_drop_consent
+from app import create_app, db
+from app.models import Customer, Vehicle, SalesStats, SalesDailyRollup, SaleRequest
+from app.outbox import outbox_worker
+
+PURCHASE_PRICE = Decimal('10000.00')
+
+
+def seed(vehicles):
+    db.drop_all()
+    db.create_all()
+    db.session.add(Customer(customer_id=1, first_name='Dealer', last_name='Stock',
+                            total_spent=Decimal(0), total_profit=Decimal(0)))
+    db.session.add_all(
+        Vehicle(vehicle_id=i, make='Toyota', model=f'Model{i % 5}', year=2018, vin=f'RACE{i:013d}',
+                purchase_price=PURCHASE_PRICE, owner_id=1, created_at=date.today())
+        for i in range(1, vehicles + 1)
+    )
+    db.session.commit()
+
+
+def submissions(args, rng):
+    """Competing sales per vehicle, each listed twice under one idempotency key."""
+    attempts = []
+    for vehicle_id in range(1, args.vehicles + 1):
+        for _ in range(args.contenders):
+            sale = {
+                'vehicle_id': str(vehicle_id),
+                'first_name': f'Buyer{rng.randrange(args.buyers)}',
+                'last_name': 'Race',
+                'sale_price': f'{rng.randrange(11_000, 15_000)}.00',
+                'sold_at': '2024-06-01',
+                'idempotency_key': uuid.uuid4().hex,
+            }
+            attempts.extend([sale, sale])
+    rng.shuffle(attempts)
+    return attempts
+
+
+def outcome(messages):
+    """Classify a submission by the message flashed for it."""
+    for category, message in messages:
+        if category == 'success':
+            return 'recorded'
+        if message == "This car sale was already recorded.":
+            return 'replayed'
+        if message == "Vehicle has already been sold.":
+            return 'rejected'
+    return 'error'
+
+
+def run(app, attempts, threads):
+    local = threading.local()
+
+    def submit(sale):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        local.client.post('/sell_car', data=sale).close()
+        elapsed = time.perf_counter() - start
+        with local.client.session_transaction() as session:
+            messages = session.pop('_flashes', [])
+        return outcome(messages), elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(submit, attempts))
+    return time.perf_counter() - start, results
+
+
+def check(args, outcomes):
+    """Return a list of invariant violations found in the database."""
+    failures = []
+    vehicles = Vehicle.query.all()
+    unsold = [v.vehicle_id for v in vehicles if v.sold_at is None]
+    if unsold:
+        failures.append(f"{len(unsold)} vehicles left unsold, e.g. {unsold[:5]}")
+    if outcomes['recorded'] != args.vehicles:
+        failures.append(f"{outcomes['recorded']} sales recorded for {args.vehicles} vehicles")
+    if outcomes['error']:
+        failures.append(f"{outcomes['error']} submissions failed with an error")
+
+    expected = {}
+    for vehicle in vehicles:
+        if vehicle.sold_at is None:
+            continue
+        if vehicle.profit != vehicle.sale_price - PURCHASE_PRICE:
+            failures.append(f"vehicle {vehicle.vehicle_id}: profit {vehicle.profit} != sale - purchase")
+        spent, profit = expected.get(vehicle.owner_id, (Decimal(0), Decimal(0)))
+        expected[vehicle.owner_id] = (spent + vehicle.sale_price, profit + vehicle.profit)
+    for customer in Customer.query.filter(Customer.last_name == 'Race'):
+        spent, profit = expected.get(customer.customer_id, (Decimal(0), Decimal(0)))
+        if (customer.total_spent, customer.total_profit) != (spent, profit):
+            failures.append(f"customer {customer.customer_id}: totals {customer.total_spent}/"
+                            f"{customer.total_profit}, purchases {spent}/{profit}")
+
+    stats = Counter()
+    for row in SalesStats.query:
+        stats[row.vehicle_stat_id] += row.cars_sold
+    oversold = {vehicle_id: count for vehicle_id, count in stats.items() if count != 1}
+    if oversold or len(stats) != args.vehicles:
+        failures.append(f"sales stats count {len(stats)} vehicles, miscounted: {dict(list(oversold.items())[:5])}")
+
+    rollup_sold = db.session.query(db.func.sum(SalesDailyRollup.cars_sold)).scalar() or 0
+    rollup_profit = db.session.query(db.func.sum(SalesDailyRollup.total_profit)).scalar() or 0
+    vehicle_profit = db.session.query(db.func.sum(Vehicle.profit)).scalar() or 0
+    if (rollup_sold, rollup_profit) != (args.vehicles, vehicle_profit):
+        failures.append(f"rollup {rollup_sold} sold / {rollup_profit} profit, "
+                        f"vehicles {args.vehicles} / {vehicle_profit}")
+
+    owners = {vehicle.vehicle_id: vehicle.owner_id for vehicle in vehicles}
+    stored = SaleRequest.query.all()
+    if len(stored) != args.vehicles:
+        failures.append(f"{len(stored)} idempotency keys stored for {args.vehicles} sales")
+    for request in stored:
+        if owners.get(request.vehicle_id) != request.customer_id:
+            failures.append(f"idempotency key {request.idempotency_key} points at the wrong sale")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vehicles', type=int, default=100)
+    parser.add_argument('--contenders', type=int, default=4, help="competing sales per vehicle")
+    parser.add_argument('--buyers', type=int, default=10, help="distinct buyers shared by all sales")
+    parser.add_argument('--threads', default='1,4,8,16')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--drop', action='store_true',
+                        help="Allow dropping all tables in a non-SQLite --database-uri.")
+    args = parser.parse_args()
+    if args.database_uri:
+        require_drop_consent(args.database_uri, args.drop)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database_uri or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app(make_config(uri))
+        print(f"{args.vehicles} vehicles x {args.contenders} contenders x 2 submissions, "
+              f"{args.buyers} buyers")
+        print(f"{'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'recorded':>9} {'replayed':>9} {'rejected':>9} {'errors':>7} {'drain ms':>9}  checks")
+        for threads in (int(value) for value in args.threads.split(',')):
+            with app.app_context():
+                seed(args.vehicles)
+            attempts = submissions(args, random.Random(args.seed))
+            elapsed, results = run(app, attempts, threads)
+            outcomes = Counter(kind for kind, _ in results)
+            latencies = [seconds * 1000 for _, seconds in results]
+            with app.app_context():
+                drain_start = time.perf_counter()
+                outbox_worker.drain()
+                drain = time.perf_counter() - drain_start
+                failures = check(args, outcomes)
+            print(f"{threads:>7} {len(attempts) / elapsed:>8.0f} {percentile(latencies, 50):>8.1f} "
+                  f"{percentile(latencies, 99):>8.1f} {outcomes['recorded']:>9} {outcomes['replayed']:>9} "
+                  f"{outcomes['rejected']:>9} {outcomes['error']:>7} {drain * 1000:>9.1f}  {'ok' if not failures else 'FAILED'}")
+            for failure in failures:
+                print(f"    {failure}")
+            failed = failed or bool(failures)
+        with app.app_context():
+            db.engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
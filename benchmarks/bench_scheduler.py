@@ -0,0 +1,122 @@
+"""Load test for the service bay scheduler.
+
+Usage: python benchmarks/bench_scheduler.py [--per-day N] [--days N] [--bays N]
+
+Seeds a SQLite database with N appointments per day, rebuilds the slot
+index from it, then times next-free-slot and utilisation queries and
+books appointments from several threads into a two-hour window until
+the bays are full, checking that no slot ends up over capacity.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from common import make_config, percentile
+from app import create_app, db
+from app.models import ServiceAppointment
+from app.scheduler import service_scheduler, to_time
+
+
+def scheduler_config(database_uri, bays):
+    return make_config(
+        database_uri,
+        SERVICE_BAYS=bays,
+        SERVICE_SLOT_MINUTES=5,
+        SERVICE_OPEN_HOUR=0,
+        SERVICE_CLOSE_HOUR=24,
+        SERVICE_DEFAULT_DURATION=30,
+    )
+
+
+def seed(per_day, days, start):
+    db.drop_all()
+    db.create_all()
+    rows = []
+    for offset in range(days):
+        for _ in range(per_day):
+            arrival = random.randrange(0, 23 * 60, 5)
+            rows.append({
+                'appt_date': start + timedelta(days=offset),
+                'arrival_time': to_time(arrival),
+                'completion_time': to_time(arrival + random.choice((30, 45, 60))),
+            })
+    db.session.execute(db.insert(ServiceAppointment), rows)
+    db.session.commit()
+
+
+def timed(label, func, runs):
+    samples = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - begin) * 1000)
+    print(f"{label}: p50 {percentile(samples, 50):.3f} ms, p99 {percentile(samples, 99):.3f} ms")
+
+
+def book_until_full(app, day, attempts, results):
+    # Arrivals fall in a two-hour window so the bays fill up and bookings start failing
+    with app.app_context():
+        for _ in range(attempts):
+            arrival = random.randrange(9 * 60, 11 * 60, 5)
+            with service_scheduler.booking(day, to_time(arrival), 30) as completion_time:
+                if completion_time is None:
+                    db.session.rollback()
+                    results['rejected'] += 1
+                    continue
+                db.session.add(ServiceAppointment(appt_date=day, arrival_time=to_time(arrival),
+                                                  completion_time=completion_time))
+                db.session.commit()
+                results['booked'] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-day', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--bays', type=int, default=150)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=300, help="booking attempts per thread")
+    args = parser.parse_args()
+    random.seed(42)
+    start = date.today()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app(scheduler_config(uri, args.bays))
+        with app.app_context():
+            seed(args.per_day, args.days, start)
+            begin = time.perf_counter()
+            loaded = service_scheduler.rebuild(start)
+            print(f"rebuild: {loaded} appointments in {(time.perf_counter() - begin) * 1000:.1f} ms")
+
+            timed("next free slot", lambda: service_scheduler.next_free_slot(
+                1, start + timedelta(days=random.randrange(args.days)), to_time(random.randrange(0, 1380))), 2000)
+            timed("week utilisation", lambda: service_scheduler.utilisation(start, 7), 2000)
+
+        day = start + timedelta(days=args.days)
+        results = {'booked': 0, 'rejected': 0}
+        threads = [threading.Thread(target=book_until_full, args=(app, day, args.attempts, results))
+                   for _ in range(args.threads)]
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+        print(f"concurrent booking: {results['booked']} booked, {results['rejected']} rejected "
+              f"in {elapsed:.2f}s")
+
+        with app.app_context():
+            service_scheduler.rebuild(start)
+            peak = max(service_scheduler.index.days[day])
+            db.engine.dispose()
+        print(f"peak bays in use on {day}: {peak} of {args.bays}")
+        assert peak <= args.bays, "overbooked"
+
+
+if __name__ == '__main__':
+    main()
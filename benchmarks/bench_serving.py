@@ -0,0 +1,106 @@
+"""Throughput of the Flask debug server versus the gunicorn production setup.
+
+Usage: python benchmarks/bench_serving.py [--seconds N] [--concurrency N] [--workers N]
+
+Seeds a temporary SQLite database, starts each server against it in turn
+and drives a mix of read endpoints from concurrent client threads.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from common import ROOT, make_config
+from app import create_app, db
+from bench_bulk_sales import seed
+
+PATHS = ('/', '/service', '/api/v1/vehicles?limit=50', '/api/v1/customers/1')
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+def drive(base_url, seconds, concurrency):
+    counts = {'ok': 0, 'error': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client(offset):
+        i = offset
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(base_url + PATHS[i % len(PATHS)], timeout=10).read()
+                outcome = 'ok'
+            except OSError:
+                outcome = 'error'
+            with lock:
+                counts[outcome] += 1
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def run_server(name, command, env, port, args, cwd):
+    process = subprocess.Popen(command, cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url)
+        counts = drive(base_url, args.seconds, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    print(f"{name}: {counts['ok'] / args.seconds:.0f} req/s ({counts['error']} errors)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = create_app(make_config(uri))
+        with app.app_context():
+            seed(args.rows)
+            db.engine.dispose()
+
+        # Servers run from the temp dir so their log files stay out of the tree
+        env = dict(os.environ, DATABASE_URL=uri, SECRET_KEY='bench-only', SLOW_REQUEST_THRESHOLD_MS='100000',
+                   PYTHONPATH=ROOT)
+        run_server(
+            "flask debug server",
+            [sys.executable, '-c',
+             "from run import app; app.run(port=5051, debug=True, use_reloader=False)"],
+            env, 5051, args, tmp,
+        )
+        run_server(
+            f"gunicorn ({args.workers} workers)",
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '-b', '127.0.0.1:5052', '-w', str(args.workers), 'wsgi:app'],
+            env, 5052, args, tmp,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Measure cold-start time: imports, create_app, the schema check and first requests.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--database-uri URI]
+
+Each run is a fresh interpreter that imports the app, builds it, runs the
+boot-time schema check and serves its first request, then the first sale
+bill and the first analytics report, which load ReportLab and NumPy on
+demand. The first run starts from an empty database, so its schema check
+creates the tables. Warm starts then alternate between the cached schema
+check, which finds the stored fingerprint current, and the unconditional
+create_all it replaces, for comparison. Exits 1 when the median of a
+cached-check phase exceeds its budget, when a warm start re-applies the
+schema, or when ReportLab or NumPy is loaded before the first request
+that needs it. Defaults to a temporary SQLite file.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+START = time.perf_counter()
+
+# Median milliseconds per warm-start phase before the run fails
+BUDGETS = {
+    'import': 1000,
+    'create_app': 200,
+    'schema check': 50,
+    'first request': 100,
+    'time to first request': 1500,
+}
+PHASES = ('import', 'create_app', 'schema check', 'first request', 'time to first request',
+          'first bill', 'first analytics')
+
+
+def child(uri, scratch, mode):
+    """Boot the app in this fresh process and print phase timings as JSON."""
+    from common import make_config
+    from app import create_app, db
+    from app.schema import ensure_schema
+    from app.startup import loaded_lazy_modules
+    timings = {'import': time.perf_counter() - START}
+
+    mark = time.perf_counter()
+    app = create_app(make_config(uri, BILL_CACHE_DIR=os.path.join(scratch, 'bills'),
+                                 ANALYTICS_SNAPSHOT_DIR=os.path.join(scratch, 'analytics'),
+                                 OUTBOX_WORKER_THREAD=False))
+    timings['create_app'] = time.perf_counter() - mark
+
+    with app.app_context():
+        mark = time.perf_counter()
+        if mode == 'create_all':
+            db.create_all(bind_key=None)
+            applied = None
+        else:
+            applied = ensure_schema()
+        timings['schema check'] = time.perf_counter() - mark
+
+    client = app.test_client()
+    mark = time.perf_counter()
+    # A page that queries, so the first request pays ORM setup as a real one would
+    client.get('/api/v1/vehicles').close()
+    timings['first request'] = time.perf_counter() - mark
+    timings['time to first request'] = time.perf_counter() - START
+    loaded_at_first_request = loaded_lazy_modules()
+
+    if applied is False:
+        mark = time.perf_counter()
+        client.get('/bill/1').close()
+        timings['first bill'] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        client.get('/api/v1/analytics/monthly').close()
+        timings['first analytics'] = time.perf_counter() - mark
+
+    with app.app_context():
+        db.engine.dispose()
+    print(json.dumps({
+        'applied': applied,
+        'timings': {phase: seconds * 1000 for phase, seconds in timings.items()},
+        'loaded_at_first_request': loaded_at_first_request,
+        'loaded_at_exit': loaded_lazy_modules(),
+    }))
+
+
+def seed(uri):
+    """Add one sold car so the bill and analytics requests have something to render."""
+    from datetime import date
+    from decimal import Decimal
+    from common import make_config
+    from app import create_app, db
+    from app.models import Customer, Vehicle
+    app = create_app(make_config(uri))
+    with app.app_context():
+        db.session.add(Customer(customer_id=1, first_name='Cold', last_name='Start',
+                                total_spent=Decimal(0), total_profit=Decimal(0)))
+        db.session.add(Vehicle(vehicle_id=1, make='Toyota', model='Camry', year=2020, vin='COLDSTART00000001',
+                               purchase_price=Decimal('10000.00'), sale_price=Decimal('12000.00'),
+                               profit=Decimal('2000.00'), sold_at=date.today(), owner_id=1,
+                               created_at=date.today()))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def boot(uri, scratch, mode):
+    """Run one cold start in a subprocess and return its report."""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', uri, scratch, mode],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"cold start failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="warm starts of each kind after the first")
+    parser.add_argument('--database-uri')
+    parser.add_argument('--child', nargs=3, metavar=('URI', 'SCRATCH', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    from common import percentile
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database_uri or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        first = boot(uri, os.path.join(tmp, 'first'), 'ensure')
+        seed(uri)
+        warm, create_all = [], []
+        for run in range(args.runs):
+            warm.append(boot(uri, os.path.join(tmp, f'cached{run}'), 'ensure'))
+            create_all.append(boot(uri, os.path.join(tmp, f'create_all{run}'), 'create_all'))
+    reports = [first] + warm + create_all
+
+    def median(reports, phase):
+        samples = [report['timings'][phase] for report in reports if phase in report['timings']]
+        return percentile(samples, 50) if samples else None
+
+    def cell(value):
+        return '' if value is None else f'{value:.1f}'
+
+    print(f"{'phase (ms)':<24} {'first boot':>11} {'cached p50':>11} {'create_all p50':>15} {'budget':>7}")
+    for phase in PHASES:
+        cached, budget = median(warm, phase), BUDGETS.get(phase)
+        print(f"{phase:<24} {cell(first['timings'].get(phase)):>11} {cell(cached):>11} "
+              f"{cell(median(create_all, phase)):>15} {budget or '':>7}")
+        if budget and cached is not None and cached > budget:
+            failures.append(f"{phase}: p50 {cached:.1f} ms (budget {budget} ms)")
+
+    if not first['applied']:
+        failures.append("the first boot did not apply the schema")
+    if any(report['applied'] for report in warm):
+        failures.append("a warm boot re-applied an unchanged schema")
+    for report in reports:
+        if report['loaded_at_first_request']:
+            failures.append(f"loaded before first use: {', '.join(report['loaded_at_first_request'])}")
+            break
+    print(f"lazy modules loaded after the first bill and report: "
+          f"{', '.join(warm[-1]['loaded_at_exit']) if warm else 'n/a'}")
+    if failures:
+        print("startup check failed:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
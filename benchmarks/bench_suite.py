@@ -0,0 +1,251 @@
+"""Scenario benchmarks for the hot request paths.
+
+Usage: python benchmarks/bench_suite.py [--scale 10k|100k|1m] [--database-uri URI]
+                                        [--requests N] [--reuse] [--check] [--replica] [--drop]
+
+Generates (or, with --reuse, keeps) a synthetic dataset, then drives
+sell_car, sales_statistics, schedule_service, generate_bill,
+generate_service_bill and search_vehicles through the Flask test client.
+Reports latency percentiles and SQL statements per request. The run fails
+when the N+1 detector sees a request repeat a statement, and with --check
+also when a scenario issues more statements than its budget or, after a
+bulk sale and a reversal on top of the scenarios' sales, the rollup's
+per-model totals differ from the GROUP BY over vehicle they replace. With
+--replica, read-only endpoints are served from a SQLite stand-in replica
+(a copy of the generated data) and the share of statements it ran is
+reported per scenario. Generating drops every table, so a non-SQLite
+--database-uri needs --drop unless --reuse is given.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from common import make_config, percentile, require_drop_consent
+from app import create_app, db
+from app.cache import result_cache
+from app.models import Customer, Vehicle, ServiceAppointment, ServicePackage
+from app.analytics import sales_analytics
+from app.nplusone import detector
+from app.outbox import outbox_worker
+from app.rollup import apply_deltas, new_deltas, sale_delta, sales_by_model
+from app.routing import replica_router
+from app.search import inventory_index
+from datagen import SCALES, generate
+
+# Maximum SQL statements per request before --check reports a regression
+QUERY_BUDGETS = {
+    'sell_car': 7,
+    'sales_statistics': 2,
+    'schedule_service': 7,
+    'generate_bill': 1,
+    'generate_service_bill': 1,
+    'search_vehicles': 0,
+}
+
+
+class Scenarios:
+    """Builds randomised requests for each scenario from ids sampled out of the dataset."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.unsold = [row[0] for row in db.session.execute(
+            db.select(Vehicle.vehicle_id).where(Vehicle.sold_at.is_(None)).limit(20_000))]
+        self.sold = [row[0] for row in db.session.execute(
+            db.select(Vehicle.vehicle_id).where(Vehicle.sold_at.isnot(None)).limit(20_000))]
+        self.names = db.session.execute(
+            db.select(Customer.first_name, Customer.last_name).limit(20_000)).all()
+        self.appointments = [row[0] for row in db.session.execute(
+            db.select(ServiceAppointment.appt_id).limit(20_000))]
+        self.packages = [row[0] for row in db.session.execute(db.select(ServicePackage.pkg_id))]
+        self.makes = [row[0] for row in db.session.execute(db.select(Vehicle.make).distinct())]
+        self.rng.shuffle(self.unsold)
+        inventory_index.rebuild()
+        sales_analytics.refresh(full=True)
+
+    def sell_car(self, client):
+        first, last = self.rng.choice(self.names)
+        client.post('/sell_car', data={
+            'vehicle_id': self.unsold.pop(),
+            'first_name': first,
+            'last_name': last,
+            'sale_price': str(self.rng.randrange(10_000, 70_000)),
+            'sold_at': str(date(2024, 1, 1) + timedelta(days=self.rng.randrange(365))),
+        })
+
+    def sales_statistics(self, client):
+        # Measure the database path, not the result cache
+        result_cache.clear()
+        start = date(2018, 1, 1) + timedelta(days=self.rng.randrange(365 * 5))
+        client.post('/sales_statistics', data={
+            'start_date': str(start),
+            'end_date': str(start + timedelta(days=self.rng.randrange(7, 365))),
+        })
+
+    def schedule_service(self, client):
+        client.post('/service', data={
+            'service_package_id': self.rng.choice(self.packages),
+            'vehicle_id': self.rng.choice(self.sold),
+            'appt_date': str(date(2030, 1, 1) + timedelta(days=self.rng.randrange(365))),
+            'arrival_time': f"{self.rng.randrange(8, 15):02d}:{self.rng.choice((0, 15, 30, 45)):02d}",
+        })
+
+    def generate_bill(self, client):
+        client.get(f'/bill/{self.rng.choice(self.sold)}').close()
+
+    def generate_service_bill(self, client):
+        client.get(f'/service_bill/{self.rng.choice(self.appointments)}').close()
+
+    def search_vehicles(self, client):
+        client.get('/vehicles/search', query_string={
+            'make': self.rng.choice(self.makes),
+            'status': self.rng.choice(('sold', 'unsold')),
+            'year_min': self.rng.randrange(2005, 2020),
+        })
+
+
+def exercise_rollup(client, scenarios):
+    """Sell a batch through /sales/bulk, then reverse one sale as a correction would."""
+    vehicle_ids = [scenarios.unsold.pop() for _ in range(20)]
+    first, last = scenarios.rng.choice(scenarios.names)
+    client.post('/sales/bulk', content_type='application/x-ndjson', data='\n'.join(json.dumps({
+        'vehicle_id': vehicle_id, 'first_name': first, 'last_name': last,
+        'sale_price': str(scenarios.rng.randrange(10_000, 70_000)), 'sold_at': '2024-06-01',
+    }) for vehicle_id in vehicle_ids))
+    outbox_worker.drain()
+
+    vehicle = db.session.get(Vehicle, vehicle_ids[0])
+    deltas = new_deltas()
+    sale_delta(deltas, vehicle.sold_at, vehicle.make, vehicle.model, vehicle.profit, sign=-1)
+    apply_deltas(deltas)
+    vehicle.sold_at = vehicle.sale_price = vehicle.profit = None
+    db.session.commit()
+
+
+def rollup_mismatches(rng):
+    """Compare sales_by_model with the GROUP BY over vehicle, over all time and random ranges."""
+    ranges = [(date(1900, 1, 1), date(2100, 1, 1))]
+    for _ in range(20):
+        start = date(2018, 1, 1) + timedelta(days=rng.randrange(365 * 7))
+        ranges.append((start, start + timedelta(days=rng.randrange(1, 365))))
+    mismatches = []
+    for start, end in ranges:
+        expected = {
+            (make, model): (count, Decimal(profit or 0).quantize(Decimal('0.01')))
+            for make, model, count, profit in db.session.query(
+                Vehicle.make, Vehicle.model, db.func.count(Vehicle.vehicle_id), db.func.sum(Vehicle.profit)
+            ).filter(Vehicle.sold_at.between(start, end)).group_by(Vehicle.make, Vehicle.model)
+        }
+        actual = {
+            (row['make'], row['model']): (row['cars_sold'],
+                                          Decimal(row['total_profit'] or 0).quantize(Decimal('0.01')))
+            for row in sales_by_model(start, end) if row['cars_sold']
+        }
+        for key in sorted(expected.keys() | actual.keys(), key=str):
+            if expected.get(key) != actual.get(key):
+                mismatches.append(f"{start}..{end} {key}: rollup {actual.get(key)}, "
+                                  f"vehicle table {expected.get(key)}")
+    return mismatches
+
+
+def run_scenario(client, action, requests, statements):
+    """Run one scenario; returns latencies, statements per request and the replica's share."""
+    latencies, counts = [], []
+    first = len(statements)
+    for _ in range(requests):
+        before = len(statements)
+        start = time.perf_counter()
+        action(client)
+        latencies.append((time.perf_counter() - start) * 1000)
+        counts.append(len(statements) - before)
+    issued = statements[first:]
+    replica_share = sum(1 for key, _ in issued if key is not None) / len(issued) if issued else 0.0
+    return latencies, counts, replica_share
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--database-uri')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--reuse', action='store_true', help="Keep the existing data instead of regenerating.")
+    parser.add_argument('--check', action='store_true', help="Fail when a scenario exceeds its query budget.")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--replica', action='store_true', help="Route reads to a SQLite stand-in replica.")
+    parser.add_argument('--drop', action='store_true',
+                        help="Allow dropping all tables in a non-SQLite --database-uri.")
+    args = parser.parse_args()
+    if args.database_uri and not args.reuse:
+        require_drop_consent(args.database_uri, args.drop)
+
+    tmp = tempfile.TemporaryDirectory()
+    uri = args.database_uri or f"sqlite:///{os.path.join(tmp.name, 'suite.db')}"
+    replicas = [f"sqlite:///{os.path.join(tmp.name, 'replica.db')}"] if args.replica else []
+    app = create_app(make_config(
+        uri, BILL_CACHE_DIR=os.path.join(tmp.name, 'bills'), SERVICE_BAYS=50,
+        ANALYTICS_SNAPSHOT_DIR=os.path.join(tmp.name, 'analytics'), N_PLUS_ONE_DETECT=True,
+        # Replica health and cache generations are checked once up front so the
+        # periodic probes don't count as request work
+        SQLALCHEMY_REPLICA_URIS=replicas, REPLICA_HEALTH_CHECK_SECONDS=3600,
+        CACHE_GENERATION_CHECK_SECONDS=3600,
+    ))
+    failures = []
+    with app.app_context():
+        if not args.reuse:
+            start = time.perf_counter()
+            generate(args.scale, args.seed)
+            print(f"generated {args.scale} dataset in {time.perf_counter() - start:.1f}s")
+        if replicas:
+            print(app.test_cli_runner().invoke(args=['sync-replicas']).output.strip())
+            replica_router.check_all()
+
+        statements = []
+        for key, engine in db.engines.items():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *a, key=key: statements.append((key, a[2])))
+        scenarios = Scenarios(random.Random(args.seed))
+
+        print(f"{'scenario':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'sql/req':>9}"
+              + (f"{'replica':>9}" if replicas else ""))
+        for name in QUERY_BUDGETS:
+            # A client per scenario, so the read-your-writes window after a sale
+            # doesn't keep the next scenario's reads on the primary
+            client = app.test_client()
+            latencies, counts, replica_share = run_scenario(
+                client, getattr(scenarios, name), args.requests, statements)
+            mean_sql = sum(counts) / len(counts)
+            print(f"{name:<24}{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}"
+                  f"{percentile(latencies, 99):>9.2f}{max(latencies):>9.2f}{mean_sql:>9.1f}"
+                  + (f"{replica_share:>8.0%} " if replicas else ""))
+            if max(counts) > QUERY_BUDGETS[name]:
+                failures.append(f"{name}: {max(counts)} statements (budget {QUERY_BUDGETS[name]})")
+        if args.check:
+            # Stop the in-process worker so the remaining events are applied here
+            outbox_worker.stop_thread()
+            exercise_rollup(app.test_client(), scenarios)
+            mismatches = rollup_mismatches(scenarios.rng)
+            print(f"rollup vs GROUP BY over vehicle: {len(mismatches) or 'no'} mismatches")
+            failures.extend(mismatches[:10])
+        for engine in db.engines.values():
+            engine.dispose()
+    tmp.cleanup()
+
+    if detector.violations:
+        print("repeated statements (possible N+1):")
+        for violation in detector.violations:
+            print(f"  {violation['method']} {violation['path']}: {violation['count']} x {violation['statement']}")
+    if args.check and failures:
+        print("check failed:\n  " + "\n  ".join(failures))
+    if detector.violations or (args.check and failures):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
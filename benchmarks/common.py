@@ -0,0 +1,37 @@
+"""Shared helpers for the benchmark scripts."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_config(database_uri, **overrides):
+    """Build a config class for a benchmark database, with logs kept in the temp dir."""
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'bench',
+        'LOG_FILE': os.path.join(tempfile.gettempdir(), 'car_dealership_bench.log'),
+        'SLOW_REQUEST_LOG': None,
+    }
+    settings.update(overrides)
+    return type('BenchConfig', (), settings)
+
+
+def require_drop_consent(database_uri, drop):
+    """Exit unless it is safe to drop every table: a SQLite database, or --drop was passed."""
+    if database_uri.startswith('sqlite') or drop:
+        return
+    from sqlalchemy.engine import make_url
+    sys.exit(f"Refusing to drop and recreate every table in "
+             f"{make_url(database_uri).render_as_string(hide_password=True)}; "
+             f"pass --drop if it is a scratch database.")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
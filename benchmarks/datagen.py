@@ -0,0 +1,155 @@
+"""Seeded synthetic dealership data at benchmark scales.
+
+Usage: python benchmarks/datagen.py --database-uri URI [--scale 10k|100k|1m] [--seed N] [--drop]
+
+Fills customer, vehicle, service_package, service_appointment and
+sales_stats with reproducible data (the same seed gives the same rows),
+then rebuilds the daily sales rollup. Rows are inserted with batched
+Core executemany statements so the 1M scale finishes in minutes. Every
+table is dropped first, so a non-SQLite URI also needs --drop.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from common import make_config, require_drop_consent
+from app import create_app, db
+from app.models import Customer, Vehicle, ServiceAppointment, ServicePackage, SalesStats
+from app.rollup import rebuild_rollup
+from app.scheduler import to_time
+
+# Scale name -> number of vehicles; other tables are sized relative to it
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+BATCH_SIZE = 5000
+SOLD_FRACTION = 0.6
+
+MODELS = {
+    'Toyota': ('Camry', 'Corolla', 'RAV4', 'Tacoma'),
+    'Honda': ('Civic', 'Accord', 'CR-V'),
+    'Ford': ('F-150', 'Escape', 'Mustang'),
+    'Kia': ('Rio', 'Sorento', 'Soul'),
+    'Tesla': ('Model 3', 'Model Y'),
+}
+FIRST_NAMES = ('Liam', 'Fiona', 'Ivor', 'Gary', 'Ava', 'Noah', 'Mia', 'Omar', 'Priya', 'Chen', 'Sofia', 'Yusuf')
+LAST_NAMES = ('Miller', 'Smith', 'Watson', 'Monroe', 'Garcia', 'Khan', 'Nguyen', 'Okafor', 'Rossi', 'Schmidt')
+HISTORY_START = date(2018, 1, 1)
+HISTORY_DAYS = 365 * 6
+
+
+def sizes(vehicles):
+    return {
+        'vehicles': vehicles,
+        'customers': max(vehicles // 2, 1),
+        'appointments': vehicles,
+        'packages': 10,
+    }
+
+
+def insert_batches(model, rows):
+    """Insert an iterable of row dicts in BATCH_SIZE executemany statements."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def generate(scale, seed=42):
+    """Drop and recreate all tables, then fill them for the given scale name."""
+    rng = random.Random(seed)
+    counts = sizes(SCALES[scale])
+    makes = sorted(MODELS)
+    db.drop_all()
+    db.create_all()
+
+    insert_batches(ServicePackage, (
+        {'pkg_id': i, 'pkg_name': f'Package {i}', 'base_cost': Decimal(100 + 50 * i),
+         'created_at': HISTORY_START}
+        for i in range(1, counts['packages'] + 1)
+    ))
+
+    def customer(i):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            'customer_id': i,
+            'first_name': f'{first}{i}',
+            'last_name': last,
+            'phone': f'{rng.randrange(10**9, 10**10)}',
+            'email': f'{first.lower()}{i}@example.com',
+            'total_spent': Decimal(0),
+            'total_profit': Decimal(0),
+            'created_at': HISTORY_START,
+        }
+    insert_batches(Customer, (customer(i) for i in range(1, counts['customers'] + 1)))
+
+    def vehicle(i):
+        make = rng.choice(makes)
+        purchase = Decimal(rng.randrange(8_000, 60_000))
+        row = {
+            'vehicle_id': i,
+            'make': make,
+            'model': rng.choice(MODELS[make]),
+            'year': rng.randrange(2005, 2025),
+            'vin': f'{i:017d}',
+            'purchase_price': purchase,
+            'owner_id': rng.randrange(1, counts['customers'] + 1),
+            'created_at': HISTORY_START,
+        }
+        if rng.random() < SOLD_FRACTION:
+            sold_at = HISTORY_START + timedelta(days=rng.randrange(HISTORY_DAYS))
+            sale = purchase + Decimal(rng.randrange(-2_000, 12_000))
+            row.update(sold_at=sold_at, sale_price=sale, profit=sale - purchase)
+        return row
+    insert_batches(Vehicle, (vehicle(i) for i in range(1, counts['vehicles'] + 1)))
+
+    # One stats row per sold vehicle, derived in the database to keep memory flat
+    db.session.execute(db.insert(SalesStats).from_select(
+        ['vehicle_stat_id', 'start_date', 'end_date', 'cars_sold', 'total_profit', 'created_at'],
+        db.select(Vehicle.vehicle_id, Vehicle.sold_at, Vehicle.sold_at, db.literal(1),
+                  Vehicle.profit, Vehicle.sold_at).where(Vehicle.sold_at.isnot(None)),
+    ))
+    db.session.commit()
+
+    def appointment(i):
+        arrival = rng.randrange(8 * 60, 17 * 60, 15)
+        return {
+            'appt_id': i,
+            'appt_date': HISTORY_START + timedelta(days=rng.randrange(HISTORY_DAYS)),
+            'arrival_time': to_time(arrival),
+            'completion_time': to_time(arrival + 60),
+            'service_customer_id': rng.randrange(1, counts['customers'] + 1),
+            'vehicle_serviced_id': rng.randrange(1, counts['vehicles'] + 1),
+            'total_cost': Decimal(rng.randrange(100, 600)),
+            'created_at': HISTORY_START,
+        }
+    insert_batches(ServiceAppointment, (appointment(i) for i in range(1, counts['appointments'] + 1)))
+
+    rebuild_rollup()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--database-uri', required=True)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--drop', action='store_true',
+                        help="Allow dropping all tables in a non-SQLite --database-uri.")
+    args = parser.parse_args()
+    require_drop_consent(args.database_uri, args.drop)
+
+    app = create_app(make_config(args.database_uri))
+    start = time.perf_counter()
+    with app.app_context():
+        counts = generate(args.scale, args.seed)
+    print(f"generated {counts} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
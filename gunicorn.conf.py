@@ -0,0 +1,40 @@
+"""Gunicorn settings for serving wsgi:app in production.
+
+Each worker gets its own connection pool (sized by DB_POOL_SIZE /
+DB_MAX_OVERFLOW) which is warmed before the worker accepts requests.
+SECRET_KEY must be set in the environment; the app refuses to start without it.
+Derived sales data is applied by a separate process:
+flask --app wsgi outbox-worker
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WEB_THREADS", 2))
+worker_class = "gthread"
+timeout = int(os.environ.get("WEB_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Load the app once in the master so workers fork with code and templates already imported
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared across forked workers,
+    # whether to the primary or to a read replica
+    from app import db
+    from wsgi import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    from app.serving import warm_up
+    warm_up(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app.serving import shutdown
+    shutdown(worker.wsgi)
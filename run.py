@@ -1,9 +1,9 @@
-from app import create_app, db
+from app import create_app
+from app.schema import ensure_schema
 
 app = create_app()
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()  # Create tables if they don't exist
+        ensure_schema()  # Skips create_all when the stored schema fingerprint is current
     app.run(debug=True)
-
@@ -0,0 +1,8 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+os.environ.setdefault("APP_CONFIG", "config.ProductionConfig")
+
+from app import create_app
+
+app = create_app()